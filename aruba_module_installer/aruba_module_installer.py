@@ -36,6 +36,7 @@ SW_PATHS = {'module': 'modules/network/arubaoss',
             }
 CONTROLLER_PATHS = {'module': 'modules/network/arubaos_controller'}
 CONTROLLER_SSH_PATHS = {'module': 'modules/network/aruba',
+                       'module_utils': 'module_utils/network/arubaoss',
                        'plugins_cliconf': 'plugins/cliconf/aruba.py',
                        'plugins_terminal': 'plugins/terminal/aruba.py',
                        'plugins_action': 'plugins/action/aruba.py'
@@ -252,6 +253,7 @@ def install_wlan_modules(install_package=None):
         <ansible_module_path>/modules/network/aruba_activate
         <ansible_module_path>/modules/network/arubaos_controller
         <ansible_module_path>/modules/network/aruba_instant
+        <ansible_module_path>/module_utils/network/arubaoss
 
     Files added/modified:
         <ansible_module_path>/modules/network/aruba/aruba_command.py
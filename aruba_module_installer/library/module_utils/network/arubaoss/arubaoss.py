@@ -26,16 +26,28 @@
 # USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import os
 import re
-
-from ansible.module_utils._text import to_text
+import hashlib
+import ssl
+import atexit
+import fcntl
+import socket
+import threading
+
+from ansible.module_utils._text import to_bytes, to_native, to_text
 from ansible.module_utils.basic import env_fallback
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.network.common.config import ignore_line
 from ansible.module_utils.network.common.utils import to_list, ComplexList
 from ansible.module_utils.connection import exec_command, Connection, ConnectionError
-from ansible.module_utils.six import iteritems
+from ansible.module_utils.six import iteritems, string_types
+from ansible.module_utils.six.moves import http_client, queue
+from ansible.module_utils.six.moves.urllib.parse import urlparse
 from ansible.module_utils.urls import fetch_url
-from time import sleep
+from io import BytesIO
+from time import sleep, time
+from itertools import islice
 import json
 
 try:
@@ -47,6 +59,17 @@ except ImportError:
 
 _DEVICE_CONNECTION = None
 _DEVICE_CONFIGS = {}
+_CONFIG_CACHE_STATS = {'hits': 0, 'misses': 0}
+_API_VERSIONS = {}
+_HTTP_POOLS = {}
+# Set in the threads of parallel_map, where a failure must not exit
+_WORKER_STATE = threading.local()
+
+_IPV4_RE = re.compile(r'^\d{1,3}(\.\d{1,3}){3}$')
+# Enum values of the REST API, e.g. POM_UNTAGGED or BI_PRIMARY_IMAGE
+_ENUM_RE = re.compile(r'^[A-Z]+_[A-Z0-9_]*$')
+# List fields of REST payloads whose order means nothing to the switch
+UNORDERED_FIELDS = frozenset(['match_bit', 'trap'])
 
 arubaoss_provider_spec = {
     'host': dict(),
@@ -61,6 +84,13 @@ arubaoss_provider_spec = {
     'timeout': dict(type='int'),
     'validate_certs': dict(type='bool',default=False),
     'api_version': dict(type='str',default='None'),
+    'session_cache': dict(type='bool', default=False),
+    'session_cache_ttl': dict(type='int', default=300),
+    'session_cache_path': dict(type='path'),
+    'version_cache': dict(type='bool', default=False),
+    'version_cache_path': dict(type='path'),
+    'http_pool_size': dict(type='int', default=1),
+    'http_idle_timeout': dict(type='int', default=10),
 }
 arubaoss_argument_spec = {
     'provider': dict(type='dict', options=arubaoss_provider_spec)
@@ -76,6 +106,13 @@ arubaoss_top_spec = {
     'use_ssl': dict(type='bool'),
     'validate_certs': dict(type='bool',default=False),
     'api_version': dict(type='str'),
+    'session_cache': dict(type='bool'),
+    'session_cache_ttl': dict(type='int'),
+    'session_cache_path': dict(type='path'),
+    'version_cache': dict(type='bool'),
+    'version_cache_path': dict(type='path'),
+    'http_pool_size': dict(type='int'),
+    'http_idle_timeout': dict(type='int'),
 }
 
 arubaoss_argument_spec.update(arubaoss_top_spec)
@@ -89,19 +126,433 @@ def get_provider_argspec():
     return arubaoss_provider_spec
 
 
+class ArubaossError(Exception):
+    pass
+
+
+class HostModule:
+    '''
+    Stand-in for the AnsibleModule when a module works on several
+    switches: params are the module params updated with the ones of
+    one switch, and fail_json raises ArubaossError instead of exiting
+    so a failure only affects that switch.
+    '''
+
+    def __init__(self, module, host_params):
+        self._module = module
+        self.params = dict(module.params)
+        self.params.update(host_params)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def fail_json(self, **kwargs):
+        raise ArubaossError(kwargs.get('msg') or kwargs)
+
+
+def probe_tcp(host, port, timeout=2):
+    '''Returns whether a TCP connection to the device can be opened'''
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except (socket.error, socket.timeout):
+        return False
+    sock.close()
+    return True
+
+
+def enum_values(argument_spec):
+    '''
+    Returns the REST enum values among the choices of an argument_spec,
+    suboptions included
+    '''
+    enums = set()
+    for spec in argument_spec.values():
+        if not isinstance(spec, dict):
+            continue
+        for choice in spec.get('choices') or []:
+            if isinstance(choice, string_types) and _ENUM_RE.match(choice):
+                enums.add(choice)
+        for key in ('options', 'suboptions'):
+            if isinstance(spec.get(key), dict):
+                enums.update(enum_values(spec[key]))
+    return enums
+
+
+def _normalize_value(value, enums=()):
+    '''
+    Brings a scalar of a REST payload to the form used for comparison:
+    IPv4 octets without leading zeros, enum values of enums upper cased
+    and numeric strings as int.
+    '''
+    if isinstance(value, string_types):
+        if _IPV4_RE.match(value):
+            return '.'.join(str(int(octet)) for octet in value.split('.'))
+        if value.upper() in enums:
+            return value.upper()
+        if value.isdigit():
+            return int(value)
+    return value
+
+
+def diff_payload(payload, data, path='', enums=()):
+    '''
+    Returns the dotted paths of the fields of payload whose value differs
+    from data, as read from the switch. Only fields present on both sides
+    are compared, recursively, so attributes the switch adds (uri, stats,
+    defaults) are ignored. Case is ignored for the values of enums only,
+    and order for the lists of UNORDERED_FIELDS only.
+    '''
+    if isinstance(payload, dict) and isinstance(data, dict):
+        changed = []
+        for key in payload:
+            if key in data:
+                field = path + '.' + key if path else key
+                changed.extend(diff_payload(payload[key], data[key], field, enums))
+        return changed
+
+    if isinstance(payload, list) and isinstance(data, list):
+        if len(payload) != len(data):
+            return [path]
+        if path.split('.')[-1] not in UNORDERED_FIELDS:
+            for index, item in enumerate(payload):
+                if diff_payload(item, data[index], enums=enums):
+                    return [path]
+            return []
+        remaining = list(data)
+        for item in payload:
+            for index, candidate in enumerate(remaining):
+                if not diff_payload(item, candidate, enums=enums):
+                    del remaining[index]
+                    break
+            else:
+                return [path]
+        return []
+
+    if _normalize_value(payload, enums) != _normalize_value(data, enums):
+        return [path]
+    return []
+
+
 def check_args(module, warnings):
     pass
 
 
+class FileCache:
+    '''
+    JSON file store shared between module invocations on the controller.
+    Entries older than ttl seconds are ignored and dropped on the next
+    write, and the oldest entries are evicted beyond max_entries. Writes
+    are serialized with a lock file and replace the store atomically, so
+    parallel forks never see a partial file. The cache is best effort:
+    any I/O error is treated as a miss.
+    '''
+
+    def __init__(self, path, ttl=None, max_entries=256):
+        self._path = os.path.expanduser(path)
+        self._ttl = ttl
+        self._max_entries = max_entries
+
+    def _read(self):
+        try:
+            with open(self._path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        if self._ttl:
+            now = time()
+            entries = dict((key, entry) for key, entry in iteritems(entries)
+                           if now - entry['time'] < self._ttl)
+        return entries
+
+    def _write(self, entries):
+        if len(entries) > self._max_entries:
+            oldest = sorted(entries, key=lambda key: entries[key]['time'])
+            for key in oldest[:len(entries) - self._max_entries]:
+                del entries[key]
+
+        tmp_path = self._path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entries, f)
+        os.rename(tmp_path, self._path)
+
+    def _update(self, key, value=None):
+        '''Sets key to value, or removes it when value is None'''
+        try:
+            directory = os.path.dirname(self._path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+
+            lock = os.open(self._path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = self._read()
+                if value is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = {'time': time(), 'value': value}
+                self._write(entries)
+            finally:
+                os.close(lock)
+        except (IOError, OSError):
+            pass
+
+    def get(self, key):
+        entry = self._read().get(key)
+        if entry:
+            return entry['value']
+        return None
+
+    def put(self, key, value):
+        self._update(key, value)
+
+    def drop(self, key):
+        self._update(key)
+
+
+class HttpConnectionPool:
+    '''
+    Keep-alive HTTP(S) connections to one switch, shared by every REST
+    request of the module run so TCP and TLS handshakes are done once.
+    At most size idle connections are kept; a connection idle for more
+    than idle_timeout seconds is closed instead of being reused, and a
+    reused connection the switch has closed meanwhile is replaced once.
+    request() mirrors the (response, info) return value of fetch_url.
+    '''
+
+    def __init__(self, module, scheme, host, port, size=1, idle_timeout=10, timeout=10):
+        self._module = module
+        self._scheme = scheme
+        self._host = host
+        self._port = port
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'connections_opened': 0,
+                      'connections_reused': 0}
+
+    def _connect(self):
+        if self._scheme == 'https':
+            if self._module.params.get('validate_certs'):
+                context = ssl.create_default_context()
+            else:
+                context = ssl._create_unverified_context()
+            conn = http_client.HTTPSConnection(self._host, self._port,
+                                               timeout=self._timeout,
+                                               context=context)
+        else:
+            conn = http_client.HTTPConnection(self._host, self._port,
+                                              timeout=self._timeout)
+        with self._lock:
+            self.stats['connections_opened'] += 1
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if time() - last_used < self._idle_timeout:
+                    self.stats['connections_reused'] += 1
+                    return conn, True
+                conn.close()
+        return self._connect(), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append((conn, time()))
+                return
+        conn.close()
+
+    def request(self, url, data=None, headers=None, method='GET'):
+        parsed = urlparse(url)
+        path = parsed.path
+        if parsed.query:
+            path += '?' + parsed.query
+        if data is not None:
+            data = to_bytes(data)
+        headers = headers or {}
+
+        conn, reused = self._acquire()
+        try:
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+            except (http_client.HTTPException, socket.error):
+                if not reused:
+                    raise
+                # Switch closed the idle connection, retry on a new one
+                conn.close()
+                conn = self._connect()
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+            body = response.read()
+        except (http_client.HTTPException, socket.error) as err:
+            conn.close()
+            return None, {'url': url, 'status': -1,
+                          'msg': 'Connection failure: {}'.format(to_native(err))}
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        info = dict((key.lower(), value) for key, value in response.getheaders())
+        info.update(url=url, status=response.status)
+        if response.status >= 400:
+            info.update(msg='HTTP Error {}: {}'.format(response.status, response.reason),
+                        body=body)
+            return None, info
+
+        info['msg'] = 'OK ({} bytes)'.format(len(body))
+        return BytesIO(body), info
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                conn.close()
+
+
+def _close_http_pools(module):
+    for key, pool in iteritems(_HTTP_POOLS):
+        pool.close()
+        module.log('arubaoss http pool {}: {requests} requests, '
+                   '{connections_opened} connections opened, '
+                   '{connections_reused} reused'.format(key, **pool.stats))
+    _HTTP_POOLS.clear()
+
+
+def send_request(module, url, data=None, headers=None, method='GET'):
+    '''
+    Sends a REST request through the keep-alive pool of the switch, or
+    through fetch_url when pooling is disabled with http_pool_size 0.
+    '''
+    size = module.params.get('http_pool_size')
+    if size is None:
+        size = 1
+    if size < 1:
+        return fetch_url(module, url, data=data, headers=headers,
+                         method=method, use_proxy=False)
+
+    parsed = urlparse(url)
+    key = '{}://{}'.format(parsed.scheme, parsed.netloc)
+    pool = _HTTP_POOLS.get(key)
+    if not pool:
+        if not _HTTP_POOLS:
+            atexit.register(_close_http_pools, module)
+        pool = HttpConnectionPool(module, parsed.scheme, parsed.hostname,
+                                  parsed.port, size=size,
+                                  idle_timeout=module.params.get('http_idle_timeout') or 10)
+        _HTTP_POOLS[key] = pool
+    return pool.request(url, data=data, headers=headers, method=method)
+
+
+class SessionCache:
+    '''
+    Opt-in cache of REST login cookies, enabled with session_cache. The
+    cookie of a module run is stored at exit instead of logging out, so
+    the next arubaoss task against the same switch, user and api_version
+    skips the login. The switch session stays open until it is reused or
+    times out; session_cache_ttl should be lower than the switch idle
+    timeout so stale cookies are not even tried.
+    '''
+
+    DEFAULT_PATH = '~/.ansible/arubaoss/session_cache.json'
+    DEFAULT_TTL = 300
+
+    def __init__(self, module):
+        params = module.params
+        self._key = '{}:{}:{}:{}'.format(params['host'], params['port'],
+                                         params['username'],
+                                         params['api_version'])
+        self._cache = FileCache(params.get('session_cache_path') or self.DEFAULT_PATH,
+                                ttl=params.get('session_cache_ttl') or self.DEFAULT_TTL)
+
+    @classmethod
+    def from_module(cls, module):
+        '''Returns a SessionCache if enabled for the module, else None'''
+        if module.params.get('session_cache'):
+            return cls(module)
+        return None
+
+    def get(self):
+        return self._cache.get(self._key)
+
+    def put(self, cookie):
+        self._cache.put(self._key, cookie)
+
+    def drop(self):
+        self._cache.drop(self._key)
+
+
+class VersionCache:
+    '''
+    Cache of the REST API version discovered per switch. It is always
+    kept in memory for the module run and, with version_cache, also in
+    a file on the controller so later tasks skip the /version probe.
+    The file entry remembers the firmware it was seen with and is
+    dropped when a different firmware is reported, or after a reboot
+    or firmware transfer.
+    '''
+
+    DEFAULT_PATH = '~/.ansible/arubaoss/version_cache.json'
+    TTL = 86400
+
+    def __init__(self, module):
+        params = module.params
+        self._key = '{}:{}'.format(params['host'], params['port'])
+        self._cache = None
+        if params.get('version_cache'):
+            self._cache = FileCache(params.get('version_cache_path') or self.DEFAULT_PATH,
+                                    ttl=self.TTL)
+
+    def get(self):
+        api = _API_VERSIONS.get(self._key)
+        if not api and self._cache:
+            entry = self._cache.get(self._key)
+            if entry:
+                api = entry['api_version']
+                _API_VERSIONS[self._key] = api
+        return api
+
+    def put(self, api, firmware=None):
+        _API_VERSIONS[self._key] = api
+        if self._cache:
+            self._cache.put(self._key, {'api_version': api, 'firmware': firmware})
+
+    def check_firmware(self, firmware):
+        '''Drops the file entry if it was discovered on another firmware'''
+        if not self._cache:
+            return
+        entry = self._cache.get(self._key)
+        if not entry:
+            return
+        if entry.get('firmware') is None:
+            self._cache.put(self._key, {'api_version': entry['api_version'],
+                                        'firmware': firmware})
+        elif entry['firmware'] != firmware:
+            self._cache.drop(self._key)
+
+    def drop(self):
+        _API_VERSIONS.pop(self._key, None)
+        if self._cache:
+            self._cache.drop(self._key)
+
+
 class Checkversion:
     '''
     Here we set default REST API version as v6.0 to login &
     retrieve REST version supported in switch.
     '''
 
-    def __init__(self, module):
+    def __init__(self, module, cookie=None):
         self._module = module
-        self._cookie = None
+        self._cookie = cookie
 
         host = self._module.params['host']
         port = self._module.params['port']
@@ -125,14 +576,12 @@ class Checkversion:
         '''Sends command to device '''
 
         headers = {'Content-Type': 'application/json'}
-        data = self._module.jsonify(body)
 
         if self._cookie:
             headers['Cookie'] = self._cookie
 
-        response, headers = fetch_url(
-            self._module, url, data=body, headers=headers,
-            method=method, use_proxy=False)
+        response, headers = send_request(
+            self._module, url, data=body, headers=headers, method=method)
 
         return response, headers
 
@@ -183,14 +632,26 @@ class Checkversion:
         if headers['status'] != 204:
             self._module.fail_json(**headers)
 
-    def get_version(self):
-        ''' GET Version from device '''
+    def get_version(self, keep_session=False):
+        '''
+        GET Version from device. If keep_session is set, the login
+        session is left open and its cookie is returned so that it
+        can be handed over to Aossapi instead of logging in again.
+        A cookie given at init is tried first and replaced by a new
+        login if the switch rejects it.
+        '''
 
-        self.login()
+        if not self._cookie:
+            self.login()
 
         url = self._url[:-5] + "/version"
         response, headers = self._send(url, body="", method='GET')
 
+        if headers['status'] == 401 and self._cookie:
+            self._cookie = None
+            self.login()
+            response, headers = self._send(url, body="", method='GET')
+
         if headers['status'] == 200:
             body = response.read()
             body=json.loads(body)
@@ -199,17 +660,49 @@ class Checkversion:
         else:
             self._module.fail_json(**headers)
 
+        if keep_session:
+            return self._cookie
+
         self.logout()
 
 
-def load_params(module):
+def load_provider_params(module):
     provider = module.params.get('provider') or dict()
     for key, value in iteritems(provider):
         if key in arubaoss_argument_spec:
             if module.params.get(key) is None and value is not None:
                 module.params[key] = value
-    check = Checkversion(module)
-    return check.get_version()
+
+
+def load_params(module, keep_session=False, cookie=None):
+    '''
+    Sets api_version, probing the switch only when it was neither given
+    explicitly nor found in the version cache.
+    '''
+    load_provider_params(module)
+    if module.params.get('api_version') not in (None, 'None'):
+        return cookie
+
+    version_cache = VersionCache(module)
+    api = version_cache.get()
+    if api:
+        module.params['api_version'] = api
+        return cookie
+
+    check = Checkversion(module, cookie=cookie)
+    cookie = check.get_version(keep_session=keep_session)
+    version_cache.put(module.params['api_version'])
+    return cookie
+
+
+def clear_api_version(module):
+    '''
+    Forgets the cached REST API version of the switch. To be called once
+    the firmware may have changed, e.g. after a reboot or an image
+    download.
+    '''
+    load_provider_params(module)
+    VersionCache(module).drop()
 
 
 def get_connection(module, is_cli=False):
@@ -223,23 +716,47 @@ def get_connection(module, is_cli=False):
             _DEVICE_CONNECTION = module._arubaoss_connection
             return module._arubaoss_connection
         else:
-            load_params(module)
-            conn = Aossapi(module)
+            load_provider_params(module)
+            session_cache = SessionCache.from_module(module)
+            cookie = session_cache.get() if session_cache else None
+            cookie = load_params(module, keep_session=True, cookie=cookie)
+            conn = Aossapi(module, cookie=cookie, session_cache=session_cache)
             _DEVICE_CONNECTION = conn
     return _DEVICE_CONNECTION
 
 
+def _uri_root(uri):
+    '''Returns the root of the first path segment, e.g. vlans for /vlans-ports/1'''
+    return uri.split('?')[0].lstrip('/').split('/')[0].split('-')[0]
+
+
 class Aossapi:
     '''
     This create instance for arubaoss api. The supported version of
     api is v5.0. Previous version can be used to configure but does
     not gurantee module will work as intended or may have failure
     in cases.
+
+    A single login session is opened on first use and shared by every
+    get_config/run_commands call of the module run. It is closed once
+    when the module exits, and re-established if the switch answers
+    with 401 (session expired or cleared on the switch). With a
+    session_cache the session is kept open at exit and its cookie is
+    stored for the next module run instead.
+
+    GET answers are memoized for the module run. A write evicts every
+    cached uri whose first path segment has the same root, the part
+    before any '-', e.g. a POST to /vlans-ports evicts /vlans-ports/...
+    but also /vlans and /vlans/... as they are related collections of
+    the switch, and a write to /vlans evicts /vlans-ports as well.
     '''
 
-    def __init__(self, module):
+    def __init__(self, module, cookie=None, session_cache=None):
         self._module = module
         self._cookie = None
+        self._close_registered = False
+        self._session_cache = session_cache
+        self._get_cache = {}
 
         host = self._module.params['host']
         port = self._module.params['port']
@@ -255,23 +772,49 @@ class Aossapi:
 
         self._url = "{}://{}:{}/rest/{}".format(proto,host,port,api)
 
-    def _send(self, url, method='POST', body={}):
+        if cookie:
+            self._set_session(cookie)
+
+    def _send(self, url, method='POST', body={}, reauth=True):
         '''Sends command to device '''
 
         headers = {'Content-Type': 'application/json'}
 
-        data = self._module.jsonify(body)
         if self._cookie:
             headers['Cookie'] = self._cookie
-        response, headers = fetch_url(
-            self._module, url, data=body, headers=headers,
-            method=method, use_proxy=False
-        )
-        return response, headers
+        response, headers = send_request(
+            self._module, url, data=body, headers=headers, method=method)
 
+        if headers['status'] == 401 and self._cookie and reauth:
+            # Session is no longer valid on the switch, login again
+            # and replay the request once with the new cookie.
+            self._cookie = None
+            self.login()
+            return self._send(url, method=method, body=body, reauth=False)
 
-    def login(self):
-        ''' Created login uri and saves cookie'''
+        return response, headers
+
+    def _fail_json(self, **kwargs):
+        '''
+        Fails the module, or raises ArubaossError in a thread of
+        parallel_map so the failure is reported once by the main thread
+        '''
+        if getattr(_WORKER_STATE, 'raise_errors', False):
+            raise ArubaossError(kwargs.get('msg') or kwargs)
+        self._module.fail_json(**kwargs)
+
+    def _set_session(self, cookie):
+        '''Stores the session cookie and schedules the logout at exit'''
+        self._cookie = cookie
+        if not self._close_registered:
+            atexit.register(self.close_session)
+            self._close_registered = True
+
+    def login(self, raise_on_fail=False):
+        '''
+        Created login uri and saves cookie. With raise_on_fail, a refused
+        login raises ArubaossError, e.g. to retry while the switch boots.
+        '''
 
         password = self._module.params['password']
         username = self._module.params['username']
@@ -280,28 +823,65 @@ class Aossapi:
         data = {"userName":username ,"password": password}
         data = self._module.jsonify(data)
 
-        response, headers = self._send(url, body=data)
+        response, headers = self._send(url, body=data, reauth=False)
 
         if headers['status'] == 201:
-            self._cookie = headers.get('set-cookie')
+            self._set_session(headers.get('set-cookie'))
+        elif raise_on_fail:
+            raise ArubaossError(headers.get('msg') or 'Login failed with status {}'.format(headers['status']))
         else:
-            self._module.fail_json(**headers)
+            self._fail_json(**headers)
 
     def logout(self):
         ''' Logout from device '''
         url = self._url + "/login-sessions"
 
-        response, headers = self._send(url, body="", method='DELETE')
+        response, headers = self._send(url, body="", method='DELETE',
+                                       reauth=False)
         self._cookie = None
 
         if headers['status'] != 204:
-            self._module.fail_json(**headers)
+            self._fail_json(**headers)
 
-    def run_commands(self, uri, payload={}, method="POST", check=None,wait_after_send=0):
+    def open_session(self):
+        '''Login only if there is no session for this module run yet'''
+        if not self._cookie:
+            self.login()
+
+    def close_session(self):
+        '''
+        Logout of the session shared by the module run. This runs at
+        exit, after the module result is written, so errors are ignored
+        instead of being reported through fail_json.
+        '''
+        if self._session_cache:
+            if self._cookie:
+                self._session_cache.put(self._cookie)
+            else:
+                self._session_cache.drop()
+            return
+
+        if not self._cookie:
+            return
+
+        url = self._url + "/login-sessions"
+        try:
+            self._send(url, body="", method='DELETE', reauth=False)
+        except Exception:
+            pass
+        self._cookie = None
+
+    def run_commands(self, uri, payload={}, method="POST", check=None,wait_after_send=0,
+                     state=None, ready=None):
 
         '''
         Validate that the configuration is present on the device. If not then send command
         to device for processing. Otherwise return data to module.
+        A caller which already read the check uri can pass that answer as state
+        (raw or parsed) so the validation is done without another GET.
+        With ready, a (status uri, predicate) tuple, wait_after_send is a deadline:
+        the status uri is polled until the predicate accepts its answer instead of
+        sleeping for the whole time.
         '''
         reboot = None
         response = None
@@ -310,12 +890,13 @@ class Aossapi:
             method = 'POST'
 
         try:
-            self.login()
+            self.open_session()
 
+            changed_fields = None
             if check:
-                response = self._validate_request(method, payload, check)
+                response, changed_fields = self._validate_request(method, payload, check,
+                                                                  state=state)
                 if response:
-                    self.logout()
                     # Configuration change not required
                     return response
 
@@ -324,13 +905,22 @@ class Aossapi:
             url = self._url + uri
 
             response, headers = self._send(url, body=data, method=method)
-            sleep(wait_after_send)
+            self._invalidate(uri)
+            if ready and headers['status'] in (200, 201, 202, 204):
+                self.wait_ready(ready[0], ready[1], wait_after_send)
+            else:
+                sleep(wait_after_send)
 
-            if not reboot:
-                self.logout()
+            if reboot:
+                # Session does not survive the reboot, nothing to logout
+                self._cookie = None
+                self._get_cache.clear()
 
             if headers['status'] == 204:
-                return {'msg': 'Successful','changed':True}
+                response = {'msg': 'Successful','changed':True}
+                if changed_fields:
+                    response['changed_fields'] = changed_fields
+                return response
 
             try:
                 if response:
@@ -338,66 +928,190 @@ class Aossapi:
                     response = self._module.from_json(to_text(data, errors='surrogate_then_replace'))
                     response['header'] = headers
                     response['changed'] = True
+                    if changed_fields:
+                        response['changed_fields'] = changed_fields
                 else:
                     if headers['status'] not in (200, 201, 202, 204):
                         headers['failed'] = True
                         return headers
 
             except ValueError:
-                self._module.fail_json(msg='unable to load response from device', data=data)
+                self._fail_json(msg='unable to load response from device', data=data)
 
             return response
         except Exception as err:
-            self._module.fail_json(msg='Failed : {}'.format(err),failed=True)
+            self._fail_json(msg='Failed : {}'.format(err),failed=True)
 
-    def get_config(self, uri, check_login=True):
-        ''' Execute a GET operation of device for uri'''
+    def get_config(self, uri, check_login=True, use_cache=True):
+        '''
+        Execute a GET operation of device for uri. The answer is served
+        from the cache of the module run unless use_cache is False, which
+        is needed to poll status uris.
+        '''
         url = self._url +  uri
-        headers = {'Content-Type': 'application/json'}
 
-        no_login=False
-        if not self._cookie and check_login:
-            no_login=True
-            self.login()
+        use_cache = use_cache and check_login
+        if use_cache and uri in self._get_cache:
+            return self._get_cache[uri]
 
         if check_login:
-            headers['Cookie'] = self._cookie
-
-        response, headers = fetch_url(self._module, url, headers=headers,
-                method='GET', use_proxy=False)
-
-        if no_login:
-            self.logout()
+            self.open_session()
+            response, headers = self._send(url, body=None, method='GET')
+        else:
+            headers = {'Content-Type': 'application/json'}
+            response, headers = fetch_url(self._module, url, headers=headers,
+                    method='GET', use_proxy=False)
 
+        body = None
         if headers['status'] == 200:
-            return response.read()
+            body = response.read()
 
-        return None
+        # Not found is an answer too, unlike connection or server errors
+        if use_cache and headers['status'] in (200, 404):
+            self._get_cache[uri] = body
+
+        return body
 
-    def _validate_request(self, method, payload, check):
-        '''Compares value being applied to the configuration present on the device'''
-        check_presence = self.get_config(check)
+    def wait_ready(self, uri, predicate, timeout, interval=0.5, max_interval=4):
+        '''
+        Polls uri with exponential backoff until predicate returns True for
+        its parsed answer or timeout seconds have passed. Returns whether the
+        switch became ready.
+        '''
+        deadline = time() + timeout
+        while True:
+            answer = self.get_config(uri, use_cache=False)
+            if answer:
+                try:
+                    if predicate(self._module.from_json(to_text(answer))):
+                        return True
+                except (ValueError, KeyError):
+                    pass
+
+            remaining = deadline - time()
+            if remaining <= 0:
+                return False
+            sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def wait_for_transfer(self, timeout, min_interval=2, max_interval=10):
+        '''
+        Polls the file transfer status until it is no longer in progress or
+        timeout seconds have passed, and returns the last status. The poll
+        interval backs off while the status answer stays the same and drops
+        back to min_interval whenever the switch reports progress (any
+        change in the answer).
+        '''
+        deadline = time() + timeout
+        interval = min_interval
+        previous = None
+        final_result = ""
+        while True:
+            check_presence = self.get_config("/file-transfer/status", use_cache=False)
+            if not check_presence:
+                final_result = 'FILE TRANSFER CHECK FAILED'
+            else:
+                newdata = self._module.from_json(to_text(check_presence))
+                final_result = newdata['status']
+                if newdata['status'] != 'FTS_IN_PROGRESS':
+                    break
+                if previous is not None and newdata != previous:
+                    interval = min_interval
+                previous = newdata
+
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_interval)
+
+        return final_result
+
+    def wait_for_boot(self, timeout, down_timeout=30, probe_interval=1, rest_interval=2):
+        '''
+        Waits for the device to come back after a reboot request, cheapest
+        checks first: the REST port stops and then accepts TCP connections
+        again, /system/status answers, and the firmware version is read
+        through a new login session. Returns the firmware version, or None
+        past timeout, and the elapsed seconds at the end of each stage.
+        '''
+        params = self._module.params
+        host = params['host']
+        port = params['port'] or (443 if params['use_ssl'] else 80)
+        start = time()
+        deadline = start + timeout
+        stages = {}
+
+        # The device keeps answering for a moment after the reboot request
+        while probe_tcp(host, port) and time() - start < down_timeout:
+            sleep(probe_interval)
+        stages['down'] = round(time() - start, 1)
+
+        while not probe_tcp(host, port):
+            if time() > deadline:
+                return None, stages
+            sleep(probe_interval)
+        stages['tcp'] = round(time() - start, 1)
+
+        while not self.get_config('/system/status', check_login=False):
+            if time() > deadline:
+                return None, stages
+            sleep(rest_interval)
+        stages['rest'] = round(time() - start, 1)
+
+        while True:
+            try:
+                # The login is refused until the switch is fully up
+                if not self._cookie:
+                    self.login(raise_on_fail=True)
+                firmware = self.get_firmware()
+                break
+            except Exception:
+                if time() > deadline:
+                    return None, stages
+                sleep(rest_interval)
+        stages['firmware'] = round(time() - start, 1)
+
+        return firmware, stages
+
+    def _invalidate(self, uri):
+        '''Evicts the cached GETs related to a write on uri'''
+        root = _uri_root(uri)
+        for key in list(self._get_cache):
+            if _uri_root(key) == root:
+                self._get_cache.pop(key, None)
+
+    def _validate_request(self, method, payload, check, state=None):
+        '''
+        Compares value being applied to the configuration present on the device.
+        Returns the response to use when no change is required, and the
+        fields which differ otherwise.
+        '''
+        if state is None:
+            check_presence = self.get_config(check)
+        else:
+            check_presence = state
         if method == 'DELETE':
             if not check_presence:
                 response = {'changed': False,
                             'failed': False,
                             'msg': 'Not present'}
-                return response
+                return response, None
         elif method != 'GET':
             if check_presence:
-                diffkeys = False
-                data = self._module.from_json(to_text(check_presence))
-                for key in payload:
-                    if key in data:
-                        if payload[key] != data[key]:
-                            diffkeys = True
-                            break
-
-                if not diffkeys:
+                if isinstance(check_presence, dict):
+                    data = dict(check_presence)
+                else:
+                    data = self._module.from_json(to_text(check_presence))
+                enums = enum_values(getattr(self._module, 'argument_spec', None) or {})
+                changed_fields = diff_payload(payload, data, enums=enums)
+
+                if not changed_fields:
                     data['changed'] = False
                     data['failed'] = False
-                    return data
-        return None
+                    return data, None
+                return None, sorted(set(changed_fields))
+        return None, None
 
     def get_firmware(self):
         # Below REST API does not work on stacked switches
@@ -406,13 +1120,16 @@ class Aossapi:
         try:
             check_firmware_version = self.get_config(firmware_url)
             firmware = self._module.from_json(to_text(check_firmware_version))
-            return firmware['firmware_version']
+            firmware_version = firmware['firmware_version']
         except:
             # If try block fails then it is a stacked switch, we should be using
             # "/system/status/global_info" REST API to get the firmware version
             check_firmware_version = self.get_config(stacked_firmware_url)
             firmware = self._module.from_json(to_text(check_firmware_version))
-            return firmware['firmware_version']
+            firmware_version = firmware['firmware_version']
+
+        VersionCache(self._module).check_firmware(firmware_version)
+        return firmware_version
 
 def get_config(module, *args, **kwargs):
     conn = get_connection(module)
@@ -423,10 +1140,29 @@ def run_commands(module, commands, *args, **kwargs):
     conn = get_connection(module)
     return conn.run_commands(commands, *args, **kwargs)
 
-def run_cli_commands(module, commands, check_rc=False):
+def wait_ready(module, *args, **kwargs):
+    conn = get_connection(module)
+    return conn.wait_ready(*args, **kwargs)
+
+def wait_for_transfer(module, *args, **kwargs):
+    conn = get_connection(module)
+    return conn.wait_for_transfer(*args, **kwargs)
+
+def wait_for_boot(module, *args, **kwargs):
+    conn = get_connection(module)
+    return conn.wait_for_boot(*args, **kwargs)
+
+def run_cli_commands(module, commands, check_rc=False, batch_size=1):
     conn = get_connection(module, True)
+    for command in to_list(commands):
+        if isinstance(command, dict):
+            command = command.get('command') or ''
+        # write memory leaves the running-config as it is
+        if not command.strip().startswith(('show', 'write')):
+            _DEVICE_CONFIGS.clear()
     try:
-        return conn.run_commands(commands=commands, check_rc=check_rc)
+        return conn.run_commands(commands=commands, check_rc=check_rc,
+                                 batch_size=batch_size)
     except ConnectionError as exc:
         module.fail_json(msg=to_text(exc))
 
@@ -434,9 +1170,58 @@ def get_firmware(module):
     conn = get_connection(module)
     return conn.get_firmware()
 
+def parallel_map(func, items, workers=1):
+    '''
+    Calls func for each item with up to workers threads and returns the
+    results in the order of items. The threads share the login session
+    and connection pool of the module, so func must not rely on state
+    changed by another item. A failure of the REST connection in a
+    thread raises ArubaossError, and the first error of the threads is
+    raised again once they are all done.
+    '''
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    jobs = queue.Queue()
+    for index, item in enumerate(items):
+        jobs.put((index, item))
+
+    def worker():
+        _WORKER_STATE.raise_errors = True
+        while True:
+            try:
+                index, item = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except BaseException as err:
+                # Includes the SystemExit of a fail_json, which would
+                # only end this thread
+                errors.append(err)
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    if any(result is None for result in results):
+        raise ArubaossError('No result for some of the items')
+    return results
+
 def get_cli_config(module, flags=None):
     '''
-    Obtains the switch configuration
+    Obtains the switch configuration. With config_cache_ttl, the output
+    read by the persistent connection for a previous task is reused if
+    it is recent enough and no configuration command was run since.
     '''
     flags = [] if flags is None else flags
 
@@ -447,26 +1232,254 @@ def get_cli_config(module, flags=None):
     try:
         return _DEVICE_CONFIGS[cmd]
     except KeyError:
+        pass
+
+    max_age = module.params.get('config_cache_ttl')
+    if max_age:
+        conn = get_connection(module, True)
+        try:
+            reply = conn.get_cached(cmd, max_age)
+        except ConnectionError as exc:
+            module.fail_json(msg='unable to retrieve current config', stderr=to_text(exc))
+        _CONFIG_CACHE_STATS['hits' if reply['cached'] else 'misses'] += 1
+        out = reply['output']
+    else:
         rc, out, err = exec_command(module, cmd)
         if rc != 0:
             module.fail_json(msg='unable to retrieve current config', stderr=to_text(err, errors='surrogate_then_replace'))
-        cfg = to_text(out, errors='surrogate_then_replace').strip()
-        _DEVICE_CONFIGS[cmd] = cfg
-        return cfg
+    cfg = to_text(out, errors='surrogate_then_replace').strip()
+    _DEVICE_CONFIGS[cmd] = cfg
+    return cfg
+
+class AossConfigTree:
+    '''
+    AOS-Switch configuration indexed by section. Each line is kept under
+    the tuple of its parent lines, e.g. ('vlan 10',) for the name of vlan
+    10, so a section or a line is looked up in constant time whatever
+    the size of the configuration. Comments and the exit lines closing
+    a context are dropped.
+    '''
+
+    def __init__(self, contents=None):
+        self._items = []
+        self._sections = {}
+        self._index = set()
+        if contents:
+            self.load(contents)
+
+    def load(self, contents):
+        '''Adds the lines of a configuration text, nested by indentation'''
+        stack = []
+        for raw in contents.splitlines():
+            text = raw.strip()
+            if not text or text[0] in ';!' or text == 'exit':
+                continue
+            indent = len(raw) - len(raw.lstrip())
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            self.add([line for level, line in stack], text)
+            stack.append((indent, text))
+
+    def add(self, parents, text):
+        parents = tuple(parents)
+        if parents + (text,) in self._index:
+            return
+        self._index.add(parents + (text,))
+        self._items.append((parents, text))
+        self._sections.setdefault(parents, []).append(text)
+
+    def section(self, *parents):
+        '''Returns the lines of a section, e.g. section('vlan 10')'''
+        return list(self._sections.get(parents, []))
+
+    def has(self, parents, text):
+        return tuple(parents) + (text,) in self._index
+
+    def difference(self, other):
+        '''
+        Returns the commands adding the lines missing from other, a line
+        being preceded by its parent lines unless the previous command
+        left the CLI in that context, and the same lines grouped by
+        section.
+        '''
+        commands = []
+        sections = []
+        context = ()
+        for parents, text in self._items:
+            if other.has(parents, text):
+                continue
+            if parents != context:
+                commands.extend(parents)
+            commands.append(text)
+            if parents + (text,) in self._sections:
+                context = parents + (text,)
+            else:
+                context = parents
+
+            if not sections or sections[-1]['parents'] != list(parents):
+                sections.append({'parents': list(parents), 'lines': []})
+            sections[-1]['lines'].append(text)
+
+        return commands, sections
+
+_CONFIG_ENTRY_RE = re.compile(r'[{};]')
+
+def config_checksum(contents, ignore_lines=None):
+    '''
+    Returns the sha1 of a configuration text, hashed line by line without
+    building a config tree. As NetworkConfig does, braces and semicolons
+    are dropped, and empty lines, comments, its default ignored lines
+    ("Building configuration" and alike) and the lines matching
+    ignore_lines are skipped.
+    '''
+    ignore = [re.compile(regex) for regex in ignore_lines or []]
+    digest = hashlib.sha1()
+    for line in contents.splitlines():
+        line = _CONFIG_ENTRY_RE.sub('', line)
+        text = line.strip()
+        if not text or ignore_line(text):
+            continue
+        if any(regex.match(text) for regex in ignore):
+            continue
+        digest.update(to_bytes(line.rstrip() + '\n', errors='surrogate_or_strict'))
+    return digest.hexdigest()
+
+_TABLE_SEPARATOR_RE = re.compile(r'^\s*-+(?:\s+[-+]+)+\s*$')
+_ATTRIBUTE_RE = re.compile(r'^\s*([^:|]*[^:|\s])\s+:\s*(.*?)\s*$')
+_KEY_RE = re.compile(r'[^a-z0-9]+')
+
+# show commands, abbreviations included, with the key of their table
+SHOW_PARSERS = [
+    (re.compile(r'^sh(?:ow?)?\s+int(?:e(?:r(?:f(?:a(?:c(?:es?)?)?)?)?)?)?\s+br(?:i(?:ef?)?)?$'), 'interfaces'),
+    (re.compile(r'^sh(?:ow?)?\s+vlans?$'), 'vlans'),
+    (re.compile(r'^sh(?:ow?)?\s+lldp\s+info(?:r(?:m(?:a(?:t(?:i(?:on?)?)?)?)?)?)?\s+remote(?:-device)?$'), 'neighbors'),
+]
+
+
+def _iter_lines(text):
+    '''Yields the lines of text without splitting it into a list'''
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+        yield text[start:end].rstrip('\r')
+        start = end + 1
+
+
+def _to_key(text):
+    return _KEY_RE.sub('_', text.strip().lower()).strip('_')
+
 
-def load_config(module, commands):
+def parse_show_table(text, table_key):
     '''
-    Loads the configuration onto the switch
+    Parses the "name : value" lines and the table of a show command
+    output in a single pass. The columns of the table are given by the
+    dash runs of its separator line and named from the header lines just
+    above it; each row becomes a dict. The table rows are returned under
+    table_key.
     '''
+    parsed = {table_key: []}
+    header = []
+    columns = None
+    for line in _iter_lines(text):
+        if columns is not None:
+            if not line.strip():
+                columns = None
+                continue
+            row = {}
+            for name, start, end in columns:
+                row[name] = line[start:end].strip(' |')
+            parsed[table_key].append(row)
+            continue
+
+        if not line.strip():
+            header = []
+            continue
+        if _TABLE_SEPARATOR_RE.match(line):
+            spans = [match.span() for match in re.finditer(r'-+', line)]
+            columns = []
+            for index, span in enumerate(spans):
+                start = span[0]
+                end = spans[index + 1][0] if index + 1 < len(spans) else None
+                name = ' '.join(head[start:end].strip(' |') for head in header)
+                columns.append((_to_key(name) or 'column_{}'.format(index), start, end))
+            header = []
+            continue
+
+        match = _ATTRIBUTE_RE.match(line)
+        if match:
+            parsed[_to_key(match.group(1))] = match.group(2)
+        header = header[-1:] + [line]
+
+    return parsed
+
+
+def parse_show_output(command, output):
+    '''
+    Returns the structured output of a show command with a built-in
+    parser, or None
+    '''
+    command = ' '.join(command.lower().split())
+    for regex, table_key in SHOW_PARSERS:
+        if regex.match(command):
+            return parse_show_table(output, table_key)
+    return None
+
+def get_config_cache_stats():
+    '''
+    Returns the hits and misses of the running-config cache
+    '''
+    return dict(_CONFIG_CACHE_STATS)
+
+def clear_cli_config(module):
+    '''
+    Forgets the configurations read so far, to be called before the
+    configuration is changed. The output cached by the connection is
+    dropped whatever the config_cache_ttl of this task, as a later task
+    may reuse it.
+    '''
+    _DEVICE_CONFIGS.clear()
+    get_connection(module, True).clear_cache()
+
+def load_config(module, commands, batch_size=1, chunk_size=100):
+    '''
+    Loads the configuration onto the switch. commands can be a generator,
+    it is consumed chunk_size lines at a time so a large configuration is
+    never held in memory. Within a chunk, lines are sent batch_size at a
+    time, see Cliconf.run_commands. Returns the lines count and seconds
+    spent for each chunk, which are also reported on failure.
+    '''
+    if isinstance(commands, string_types):
+        commands = [commands]
+    commands = (command for command in commands if command != 'end')
+    # Lines sent through exec_command are not seen by the connection cache
+    clear_cli_config(module)
+
     rc, out, err = exec_command(module, 'configure terminal')
     if rc != 0:
         module.fail_json(msg='unable to enter configuration mode', err=to_text(out, errors='surrogate_then_replace'))
 
-    for command in to_list(commands):
-        if command == 'end':
-            continue
-        rc, out, err = exec_command(module, command)
-        if rc != 0:
-            module.fail_json(msg=to_text(err, errors='surrogate_then_replace'), command=command, rc=rc)
+    conn = get_connection(module, True)
+    progress = []
+    while True:
+        chunk = list(islice(commands, max(chunk_size, batch_size)))
+        if not chunk:
+            break
+
+        start = time()
+        if batch_size > 1:
+            try:
+                conn.run_commands(commands=chunk, check_rc=True, batch_size=batch_size)
+            except ConnectionError as exc:
+                module.fail_json(msg=to_text(exc), progress=progress)
+        else:
+            for command in chunk:
+                rc, out, err = exec_command(module, command)
+                if rc != 0:
+                    module.fail_json(msg=to_text(err, errors='surrogate_then_replace'),
+                                     command=command, rc=rc, progress=progress)
+        progress.append({'lines': len(chunk), 'time': round(time() - start, 2)})
 
     exec_command(module, 'end')
+    return progress
@@ -235,6 +235,7 @@ from ansible.module_utils.network.aruba.aruba import aruba_argument_spec
 from ansible.module_utils.network.aruba.aruba import check_args as aruba_check_args
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.network.common.config import NetworkConfig, dumps
+from ansible.module_utils.network.arubaoss.arubaoss import config_checksum
 
 
 def get_running_config(module, config=None):
@@ -361,31 +362,35 @@ def main():
 
             result['changed'] = True
 
-    running_config = None
-    startup_config = None
+    running_contents = None
+    startup_contents = None
 
     diff_ignore_lines = module.params['diff_ignore_lines']
 
     if module.params['save_when'] == 'always':
         save_config(module, result)
     elif module.params['save_when'] == 'modified':
-        output = run_commands(module, ['show running-config', 'show configuration'])
-
-        running_config = NetworkConfig(contents=output[0], ignore_lines=diff_ignore_lines)
-        startup_config = NetworkConfig(contents=output[1], ignore_lines=diff_ignore_lines)
+        reuse = module.params['encrypt'] and not module.params['running_config']
+        if config is not None and reuse and not result['changed']:
+            # The running-config read before is still current, and shown the
+            # same way as the startup-config
+            running_contents = config.config_text
+            startup_contents = run_commands(module, 'show configuration')[0]
+        else:
+            running_contents, startup_contents = run_commands(module, ['show running-config', 'show configuration'])
 
-        if running_config.sha1 != startup_config.sha1:
+        if config_checksum(running_contents, diff_ignore_lines) != config_checksum(startup_contents, diff_ignore_lines):
             save_config(module, result)
     elif module.params['save_when'] == 'changed':
         if result['changed']:
             save_config(module, result)
 
     if module._diff:
-        if not running_config:
+        if running_contents is None:
             output = run_commands(module, 'show running-config')
             contents = output[0]
         else:
-            contents = running_config.config_text
+            contents = running_contents
 
         # recreate the object in order to process diff_ignore_lines
         running_config = NetworkConfig(contents=contents, ignore_lines=diff_ignore_lines)
@@ -398,11 +403,11 @@ def main():
                 contents = config.config_text
 
         elif module.params['diff_against'] == 'startup':
-            if not startup_config:
+            if startup_contents is None:
                 output = run_commands(module, 'show configuration')
                 contents = output[0]
             else:
-                contents = startup_config.config_text
+                contents = startup_contents
 
         elif module.params['diff_against'] == 'intended':
             contents = module.params['intended_config']
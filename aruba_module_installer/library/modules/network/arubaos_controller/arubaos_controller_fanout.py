@@ -0,0 +1,310 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2019-2020 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+
+ANSIBLE_METADATA = {'metadata_version': '1.1',
+                    'status': ['preview'],
+                    'supported_by': 'community'}
+
+DOCUMENTATION = """
+---
+module: arubaos_controller_fanout
+version_added: 0.1
+short_description: Apply the same AOS API calls to many Mobility Masters and Mobility Controllers at once
+description:
+    - Logs in once to each controller of hosts and makes every API call of
+      objects in a single session per controller, a bounded number of
+      controllers at a time. Run it once, e.g. against localhost or with
+      run_once, as it connects to every controller of the list itself.
+options:
+    hosts:
+        description:
+            - Controllers to configure. Each item is either a hostname or IP
+              address, or a dict with host and optionally username, which
+              defaults to the module argument. All the controllers share
+              the password of the module arguments.
+        required: true
+    username:
+        description:
+            - Username used to login to the controllers
+        required: false
+    password:
+        description:
+            - Password used to login to the controllers
+        required: false
+    objects:
+        description:
+            - API calls made on each controller, in order. Each item is a
+              dict with api_name, method (GET or POST, default POST) and
+              optionally config_path and data, as for
+              arubaos_controller_config.
+        required: true
+    max_concurrency:
+        description:
+            - Max number of controllers configured at the same time.
+        default: 10
+        required: false
+    stop_on_error:
+        description:
+            - Skip the remaining API calls of a controller once one of its
+              calls failed.
+        default: true
+        required: false
+    verify_cert:
+        description:
+            - (Optional) Path to ca_cert. Defaults to "true" for installed certs. Set to "false" to prevent SSL cert check.
+        choices:
+            - /path/to/cert
+            - false
+            - true
+        required: False
+    client_cert:
+        description:
+            - (Optional) set the file path for client certificate validation from server side. Default option is None.
+        required: false
+    client_key:
+        description:
+            - (Optional) if the client_cert did not have the key, use this parameter. Default option is None.
+        required: false
+"""
+EXAMPLES = """
+#Usage Examples
+    - name: Create a ssid profile and a vlan on every controller
+      arubaos_controller_fanout:
+        hosts: "{{ groups['controllers'] }}"
+        username: admin
+        password: aruba123
+        max_concurrency: 20
+        objects:
+          - api_name: ssid_prof
+            config_path: /md/branch1/building1
+            data: { "profile-name": "test_ssid_profile", "essid" :{"essid":"test_employee_ssid"}}
+          - api_name: vlan_id
+            config_path: /md/branch1/building1
+            data: { "id": 47 }
+      run_once: true
+
+"""
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import string_types
+from ansible.module_utils.six.moves import queue
+import json
+import threading
+import requests
+
+
+def verify_param(module):
+    verify_cert = str(module.params.get('verify_cert'))
+    if verify_cert.lower() == "false":
+        return False
+    elif verify_cert.lower() == "true":
+        return True
+    return verify_cert
+
+
+def host_params(module, host):
+    if isinstance(host, string_types):
+        host = {'host': host}
+    params = {'username': module.params.get('username'),
+              'password': module.params.get('password')}
+    params.update((key, value) for key, value in host.items()
+                  if key in ('host', 'username') and value is not None)
+    return params
+
+
+def api_call(session, base_url, session_token, obj):
+    '''
+    Makes one API call on the session of a controller and returns its
+    result, as arubaos_controller_config would exit with
+    '''
+    api_name = obj.get('api_name')
+    method = obj.get('method') or 'POST'
+    config_path = obj.get('config_path')
+    data = obj.get('data')
+    result = {'api_name': api_name, 'method': method, 'config_path': config_path}
+
+    params = {'UIDARUBA': session_token}
+    if config_path not in (None, "", "null"):
+        params['config_path'] = config_path
+    url = base_url + "/configuration/object/" + str(api_name)
+    if method == "GET":
+        if api_name == "showcommand":
+            params = {"command": data["command"], "UIDARUBA": session_token}
+            url = base_url + "/configuration/" + str(api_name)
+        resp = session.get(url, params=params, headers={'Accept': 'application/json'})
+    else:
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        resp = session.post(url, params=params, data=json.dumps(data), headers=headers)
+
+    result['status_code'] = resp.status_code
+    if resp.text == "":
+        if resp.status_code != 200:
+            result.update(failed=True, msg="API call failed with status code %d" % int(resp.status_code))
+        else:
+            result.update(changed=False, msg="Success")
+        return result
+
+    response = json.loads(resp.text)
+    if method == "GET":
+        if resp.status_code == 200:
+            result.update(changed=False, msg=response.get('_data'), response=response)
+        else:
+            result.update(failed=True, msg="API call failed with status code %d" % int(resp.status_code))
+        return result
+
+    # Result will contain "Error" key if the request was made with wrong api name and data
+    if "Error" in response:
+        result.update(failed=True, msg="API Call failed! Check api name and data", reason=response['Error'])
+        return result
+    status = response['_global_result']
+    if status['status'] == 0:
+        result.update(changed=True, msg=str(status['status_str']))
+    # Example trying to delete something that do not exist will return such status
+    elif status['status'] in (1, 2):
+        result.update(skipped=True, msg=str(status['status_str']))
+    else:
+        result.update(failed=True, msg="API Call failed!", reason=status['status_str'])
+    return result
+
+
+def configure_host(module, host):
+    '''
+    Logs in to a controller with a session of its own, makes every API
+    call of objects then logs out
+    '''
+    params = host_params(module, host)
+    result = {'changed': False, 'failed': False, 'objects': []}
+    base_url = "https://" + str(params['host']) + ":4343/v1"
+
+    session = requests.Session()
+    session.verify = verify_param(module)
+    if module.params.get('client_cert'):
+        session.cert = (module.params.get('client_cert'), module.params.get('client_key'))
+
+    try:
+        data = {'username': params['username'], 'password': params['password']}
+        resp = session.post(base_url + "/api/login", data=data,
+                            headers={'Accept': 'application/json'})
+        login = json.loads(resp.text)['_global_result']
+        if str(login['status']) != "0":
+            result.update(failed=True, msg="Login Failed! Recheck the credentials you provided",
+                          reason=str(login['status_str']))
+    except Exception as e:
+        result.update(failed=True, msg="API Call failed! Exception during login", reason=str(e))
+    if result['failed']:
+        session.close()
+        return result
+
+    try:
+        for obj in module.params['objects']:
+            if result['failed'] and module.params['stop_on_error']:
+                result['objects'].append({'api_name': obj.get('api_name'), 'skipped': True,
+                                          'msg': 'Skipped after a failed API call.'})
+                continue
+            try:
+                call = api_call(session, base_url, login['UIDARUBA'], obj)
+            except Exception as e:
+                call = {'api_name': obj.get('api_name'), 'failed': True,
+                        'msg': "API Call failed!", 'reason': str(e)}
+            result['objects'].append(call)
+            result['changed'] = result['changed'] or call.get('changed', False)
+            result['failed'] = result['failed'] or call.get('failed', False)
+    finally:
+        try:
+            session.get(base_url + "/api/logout", headers={'Accept': 'application/json'})
+        except Exception:
+            pass
+        session.close()
+
+    if result['failed']:
+        result['msg'] = "API Call failed!"
+    else:
+        result['msg'] = "Success"
+    return result
+
+
+def fanout(module):
+    '''
+    Configures every controller of hosts with up to max_concurrency
+    threads and returns the results by controller
+    '''
+    hosts = module.params['hosts']
+    results = [None] * len(hosts)
+    jobs = queue.Queue()
+    for index, host in enumerate(hosts):
+        jobs.put((index, host))
+
+    def worker():
+        while True:
+            try:
+                index, host = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[index] = configure_host(module, host)
+            except Exception as e:
+                results[index] = {'changed': False, 'failed': True, 'msg': str(e)}
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(max(module.params['max_concurrency'], 1), len(hosts)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return dict((host_params(module, host)['host'], result)
+                for host, result in zip(hosts, results))
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            hosts=dict(required=True, type='list'),
+            username=dict(required=False, type='str'),
+            password=dict(required=False, type='str', no_log=True),
+            objects=dict(required=True, type='list'),
+            max_concurrency=dict(required=False, type='int', default=10),
+            stop_on_error=dict(required=False, type='bool', default=True),
+            client_cert=dict(required=False, type="str", default=None),
+            client_key=dict(required=False, type="str", default=None),
+            verify_cert=dict(required=False, type="str", default=True)
+        ))
+
+    for host in module.params['hosts']:
+        # Items of hosts are not no_log, so they must not hold a password
+        if isinstance(host, dict) and 'password' in host:
+            module.fail_json(changed=False, msg="A password of hosts would be logged, use the password argument instead")
+        params = host_params(module, host)
+        if not (params.get('host') and params.get('username') and params.get('password')):
+            module.fail_json(changed=False, msg="Check if host, username and password are provided for %s" % host)
+    for obj in module.params['objects']:
+        if not isinstance(obj, dict) or not obj.get('api_name'):
+            module.fail_json(changed=False, msg="Each object needs an api_name: %s" % obj)
+        if (obj.get('method') or 'POST') not in ('GET', 'POST'):
+            module.fail_json(changed=False, msg="method of %s must be GET or POST" % obj['api_name'])
+
+    hosts = fanout(module)
+    failed = [host for host, result in hosts.items() if result['failed']]
+    changed = any(result['changed'] for result in hosts.values())
+    if failed:
+        module.fail_json(changed=changed, hosts=hosts,
+                         msg="API calls failed on %d of %d controllers" % (len(failed), len(hosts)))
+    module.exit_json(changed=changed, hosts=hosts, msg="Success")
+
+
+if __name__ == '__main__':
+    main()
@@ -65,6 +65,14 @@ options:
     The directory must exist, but if the file doesn't exist, it will be created.
     required: False
     type: str
+  parse:
+    description: Whether to return the output of the show commands with a built-in parser
+      as structured data in 'parsed', a list such that parsed[0] is the data of commands[0]
+      or null when there is no parser for it. Parsers are built-in for 'show interfaces brief',
+      'show vlans' and 'show lldp info remote-device', abbreviations included.
+    default: False
+    required: False
+    type: bool
 '''  # NOQA
 
 EXAMPLES = '''
@@ -99,6 +107,12 @@ EXAMPLES = '''
     commands:
       - ping 10.100.0.12 repetitions 100
     output_file: /users/Home/ping.cfg
+- name: Get the VLANs and LLDP neighbors as structured data
+  arubaoss_command:
+    commands:
+      - show vlans
+      - show lldp info remote-device
+    parse: True
 '''  # NOQA
 
 RETURN = r''' # '''
@@ -110,6 +124,7 @@ from ansible.module_utils.network.common.parsing import Conditional
 from ansible.module_utils.network.common.utils import to_lines, ComplexList
 from ansible.module_utils.network.arubaoss.arubaoss import run_cli_commands as run_commands  # NOQA
 from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec  # NOQA
+from ansible.module_utils.network.arubaoss.arubaoss import parse_show_output
 
 
 def transform_commands(module):
@@ -149,6 +164,7 @@ def main():
         retries=dict(default=10, type='int'),
         interval=dict(default=1, type='int'),
         output_file=dict(type='str', default=None),
+        parse=dict(type='bool', default=False),
     )
 
     argument_spec.update(arubaoss_argument_spec)
@@ -211,6 +227,10 @@ def main():
                 output.write("------------------------------------------")
                 output.write("\n")
 
+    if module.params['parse']:
+        result['parsed'] = [parse_show_output(command, responses[i])
+                            for i, command in enumerate(commands_list)]
+
     result.update({
         'stdout': responses,
         'stdout_lines': list(to_lines(responses))
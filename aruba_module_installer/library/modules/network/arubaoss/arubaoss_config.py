@@ -46,6 +46,8 @@ options:
         exclusive with the "lines" and "parents" arguments. This src file must have same 
         indentation as a live switch config. The operation is purely additive, as it doesn't remove
         any lines that are present in the existing running-config, but not in the source config.
+        With "match" set to "none," the file is pushed while it is read, without
+        returning the commands, so that large files are not held in memory.
     required: False
     type: str
   before:
@@ -128,7 +130,8 @@ options:
         startup-config.
         If "save_when" is set to "never," the running-config will never be copied to startup-config.
         If "save_when" is set to "modified," the running-config will be copied to startup-config 
-        if the two differ.
+        if the two differ. The switch is asked with "show config status" whether they differ, 
+        falling back to comparing checksums of both configs.
         If "save_when" is set to "changed," the running-config will be copied to startup-config 
         if the task modified the running-config.
     default: never
@@ -163,6 +166,26 @@ options:
         which should be set to "intended."
     required: False
     type: str
+  batch_size:
+    description:
+      - Number of configuration lines sent to the device at once. The
+        device output is still checked for errors line by line. Empty
+        lines and lines longer than 79 characters are sent on their own.
+    default: 1
+    required: False
+    type: int
+  config_cache_ttl:
+    description:
+      - Max age in seconds of a running-config read for a previous task
+        on the same connection to be used instead of reading it again.
+        The cached running-config is dropped whenever a configuration
+        command or "write memory" is run through the connection, but not
+        when the configuration is changed by another session. The result
+        reports the cache hits and misses in "config_cache". 0 disables
+        the cache.
+    default: 0
+    required: False
+    type: int
 '''  # NOQA
 
 EXAMPLES = '''
@@ -213,9 +236,12 @@ from ansible.module_utils.network.arubaoss.arubaoss import load_config
 from ansible.module_utils.network.arubaoss.arubaoss import run_cli_commands as run_commands  # NOQA
 from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec  # NOQA
 from ansible.module_utils.network.arubaoss.arubaoss import get_cli_config as get_config  # NOQA
+from ansible.module_utils.network.arubaoss.arubaoss import get_config_cache_stats
+from ansible.module_utils.network.arubaoss.arubaoss import AossConfigTree, config_checksum
 from ansible.module_utils.network.arubaoss.arubaoss import check_args as arubaoss_check_args  # NOQA
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.network.common.config import NetworkConfig, dumps
+from itertools import chain
 
 
 def get_running_config(module, config=None):
@@ -231,6 +257,27 @@ def get_running_config(module, config=None):
     return NetworkConfig(contents=contents)
 
 
+def diff_lines(module, candidate, config=None):
+    '''
+    Line match of the candidate against the running-config, through an
+    indexed config tree instead of scanning the running-config for each
+    candidate line
+    '''
+    contents = module.params['running_config']
+    if not contents:
+        if config:
+            contents = config.config_text
+        else:
+            contents = get_config(module)
+    running = AossConfigTree(contents)
+
+    ours = AossConfigTree()
+    for item in candidate.items:
+        if item.text != 'exit':
+            ours.add(item.parents, item.text)
+    return ours.difference(running)
+
+
 def get_candidate(module):
     '''
     Gets config candidate
@@ -245,6 +292,34 @@ def get_candidate(module):
     return candidate
 
 
+def read_src(path):
+    '''
+    Yields the commands of the src file as it is read
+    '''
+    with open(path) as src:
+        for line in src:
+            line = line.strip()
+            if line and not line.startswith('!'):
+                yield line
+
+
+def config_saved(module, ignore_lines):
+    '''
+    Returns whether the running-config is saved, as reported by "show
+    config status", else by comparing the checksums of the running-config
+    and startup-config. The startup-config is also returned when read.
+    '''
+    status = run_commands(module, 'show config status')[0].lower()
+    if 'same as' in status:
+        return True, None
+    if 'needs to be saved' in status:
+        return False, None
+
+    startup = run_commands(module, 'show config config')[0]
+    running = get_config(module)
+    return config_checksum(running, ignore_lines) == config_checksum(startup, ignore_lines), startup
+
+
 def save_config(module, result):
     '''
     Saves config to memory
@@ -289,6 +364,8 @@ def main():
 
         diff_against=dict(choices=['running', 'startup', 'intended']),
         diff_ignore_lines=dict(type='list'),
+        batch_size=dict(type='int', default=1),
+        config_cache_ttl=dict(type='int', default=0),
     )
 
     argument_spec.update(arubaoss_argument_spec)
@@ -336,23 +413,40 @@ def main():
                     backupfile.write(contents)
                     backupfile.write("\n")
 
-    if any((module.params['src'], module.params['lines'])):
+    if module.params['src'] and module.params['match'] == 'none':
+        # Nothing to compare with, push the file while reading it
+        commands = chain(module.params['before'] or [],
+                         read_src(module.params['src']),
+                         module.params['after'] or [])
+        if not module.check_mode:
+            result['progress'] = load_config(module, commands,
+                                             module.params['batch_size'])
+        result['changed'] = True
+
+    elif any((module.params['src'], module.params['lines'])):
         match = module.params['match']
         replace = module.params['replace']
 
         candidate = get_candidate(module)
 
-        if match != 'none':
-            config = get_running_config(module, config)
-            path = module.params['parents']
-            configobjs = candidate.difference(
-                config, match=match, replace=replace, path=path)
+        commands = None
+        if match == 'line' and replace == 'line':
+            commands, sections = diff_lines(module, candidate, config)
+            if commands:
+                result['sections'] = sections
         else:
-            configobjs = candidate.items
+            if match != 'none':
+                config = get_running_config(module, config)
+                path = module.params['parents']
+                configobjs = candidate.difference(
+                    config, match=match, replace=replace, path=path)
+            else:
+                configobjs = candidate.items
 
-        if configobjs:
-            commands = dumps(configobjs, 'commands').split('\n')
+            if configobjs:
+                commands = dumps(configobjs, 'commands').split('\n')
 
+        if commands:
             if module.params['before']:
                 commands[:0] = module.params['before']
 
@@ -363,12 +457,12 @@ def main():
             result['updates'] = commands
 
             if not module.check_mode:
-                load_config(module, commands)
+                result['progress'] = load_config(module, commands,
+                                                 module.params['batch_size'])
 
             result['changed'] = True
 
-    running_config = None
-    startup_config = None
+    startup_contents = None
 
     diff_ignore_lines = module.params['diff_ignore_lines']
     if diff_ignore_lines is None:
@@ -380,30 +474,16 @@ def main():
     if module.params['save_when'] == 'always':
         save_config(module, result)
     elif module.params['save_when'] == 'modified':
-        output = run_commands(module,
-                              ['show running-config', 'show config config'])
-
-        running_config = NetworkConfig(
-            contents=output[0], ignore_lines=diff_ignore_lines)
-        startup_config = NetworkConfig(
-            contents=output[1], ignore_lines=diff_ignore_lines)
-
-        if running_config.sha1 != startup_config.sha1:
+        saved, startup_contents = config_saved(module, diff_ignore_lines)
+        if not saved:
             save_config(module, result)
     elif module.params['save_when'] == 'changed':
         if result['changed']:
             save_config(module, result)
 
     if module._diff:
-        if not running_config:
-            output = run_commands(module, 'show running-config')
-            contents = output[0]
-        else:
-            contents = running_config.config_text
-
-        # recreate the object in order to process diff_ignore_lines
         running_config = NetworkConfig(
-            contents=contents, ignore_lines=diff_ignore_lines)
+            contents=get_config(module), ignore_lines=diff_ignore_lines)
 
         if module.params['diff_against'] == 'running':
             if module.check_mode:
@@ -414,11 +494,11 @@ def main():
                 contents = config.config_text
 
         elif module.params['diff_against'] == 'startup':
-            if not startup_config:
+            if startup_contents is None:
                 output = run_commands(module, 'show config config')
                 contents = output[0]
             else:
-                contents = startup_config.config_text
+                contents = startup_contents
 
         elif module.params['diff_against'] == 'intended':
             with open(module.params['intended_config'], 'r') as intended_file:
@@ -434,6 +514,9 @@ def main():
                              'after': str(running_config)}
                 })
 
+    if module.params['config_cache_ttl']:
+        result['config_cache'] = get_config_cache_stats()
+
     module.exit_json(**result)
 
 
@@ -123,6 +123,9 @@ from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spe
 from ansible.module_utils._text import to_text
 from time import sleep
 
+RESTORE_IN_PROGRESS = ['CRS_IN_PROGRESS', 'CRS_FINDING_FAILED_CMDS',
+                       'CRS_CALCULATING_DIFF']
+
 
 def config_backup(module):
 
@@ -218,13 +221,14 @@ def config_restore(module):
 
 
     # Wait 40 secs for configuration to be applied
+    previous = None
     for _ in range(20):
-        get_status = get_config(module, url_status)
+        get_status = get_config(module, url_status, use_cache=False)
         if get_status:
             get_status = module.from_json(to_text(get_status))
+            previous = get_status
             status = get_status['status']
-            if status in ['CRS_IN_PROGRESS', 'CRS_FINDING_FAILED_CMDS',
-                    'CRS_CALCULATING_DIFF']:
+            if status in RESTORE_IN_PROGRESS:
                 if params['wait_for_apply']:
                     sleep(2)
                     module.log(status['status'])
@@ -235,7 +239,19 @@ def config_restore(module):
         break
 
 
-    result = run_commands(module, url, data, 'POST',wait_after_send=5)
+    # Wait until the restore is processed, at most 5 secs. The status read
+    # above is the one of the previous restore, so the restore is done once
+    # the status left the in progress states or differs from it.
+    started = []
+
+    def restore_done(status):
+        if status['status'] in RESTORE_IN_PROGRESS:
+            started.append(True)
+            return False
+        return bool(started) or status != previous
+
+    ready = (url_status, restore_done)
+    result = run_commands(module, url, data, 'POST',wait_after_send=5, ready=ready)
     message = result.get('body') or None
     if message and 'Configuration changes are temporarily disabled' in message:
         ret = {'message': message}
@@ -66,6 +66,13 @@ options:
     copy_iter:
         description:
             - Approx max iteration to wait for image copy to get completed.
+              Superseded by copy_timeout, an iteration counting as 10 secs.
+    copy_timeout:
+        description:
+            - Max time in seconds to wait for the copy to get completed.
+              The status is polled every 2 secs at first, backing off to
+              every 10 secs while it does not change.
+        required: false
 
 
 author:
@@ -84,33 +91,20 @@ EXAMPLES = '''
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.network.arubaoss.arubaoss import run_commands
 from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec, arubaoss_required_if
-from ansible.module_utils.network.arubaoss.arubaoss import get_config
-import sys, json
-from time import sleep, time
+from ansible.module_utils.network.arubaoss.arubaoss import clear_api_version
+from ansible.module_utils.network.arubaoss.arubaoss import wait_for_transfer
+import sys
+from time import time
+
 
 def wait_to_copy(module):
+    '''
+    Waits for the copy to complete, polling every 2 secs at first and
+    backing off to 10 secs while the status does not change.
+    '''
     params=module.params
-    file_url = params['file_url'].split('/')
-    file_name = file_url[len(file_url)-1]
-    final_result= ""
-    wait = 1
-    while wait <= params['copy_iter']:
-        check_presence = get_config(module, "/file-transfer/status")
-        if not check_presence:
-            final_result = 'FILE TRANSFER CHECK FAILED'
-        else:
-            newdata = json.loads(check_presence)
-            final_result = newdata['status']
-            if newdata['status'] == 'FTS_IN_PROGRESS':
-                sleep(10)
-                wait += 1
-                continue
-            else:
-                break
-
-
-
-    return final_result
+    timeout = params['copy_timeout'] or params['copy_iter'] * 10
+    return wait_for_transfer(module, timeout)
 
 
 
@@ -143,6 +137,9 @@ def transfer(module):
         total_time = int(end-start)
 
         if result == 'FTS_COMPLETED':
+            if params['file_type'] == 'FTT_FIRMWARE' and params['action'] == 'FTA_DOWNLOAD':
+                # New firmware may support another api version
+                clear_api_version(module)
             result = {'changed':True,'msg': 'image transfer  successful.','total_time':total_time}
 
         else:
@@ -170,6 +167,7 @@ def run_module():
         boot_image=dict(type='str', required=False, default='BI_PRIMARY_IMAGE',
             choices=['BI_PRIMARY_IMAGE','BI_SECONDARY_IMAGE']),
         copy_iter=dict(type='int', required=False, default=20),
+        copy_timeout=dict(type='int', required=False),
     )
 
     module_args.update(arubaoss_argument_spec)
@@ -0,0 +1,346 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+DOCUMENTATION = '''
+---
+module: arubaoss_firmware_upgrade
+
+short_description: upgrades the firmware of a list of switches
+
+version_added: "2.6"
+
+description:
+    - "This downloads a firmware image to a list of switches, a bounded
+       number of them at a time, then reboots them in waves of at most
+       max_reboots switches. Once more than max_failures switches failed,
+       no further wave is rebooted. The state of each switch can be kept
+       in a state_file so a new run resumes where the last one stopped.
+       Run it once, e.g. against localhost or with run_once, as it
+       connects to every switch of the list itself."
+
+extends_documentation_fragment:
+    - arubaoss_rest
+
+options:
+    switches:
+        description:
+            - Switches to upgrade. Each item is either a host or a dict
+              with host and optionally port, username, use_ssl and
+              api_version, which default to the module arguments. All
+              the switches share the password of the module arguments.
+        required: true
+    file_url:
+        description:
+            - Location of the firmware image on a http/https server,
+              as for arubaoss_file_transfer.
+        required: true
+    boot_image:
+        description:
+            - Flash where image needs to be copied and booted from
+        default: BI_PRIMARY_IMAGE
+        choices: BI_PRIMARY_IMAGE, BI_SECONDARY_IMAGE
+        required: false
+    firmware_version:
+        description:
+            - Firmware version of the image. Switches already running it
+              are not upgraded, and a switch booting another version is
+              reported as failed.
+        required: false
+    max_downloads:
+        description:
+            - Max number of switches downloading the image at the same
+              time, bounded by the capacity of the file server.
+        default: 4
+        required: false
+    max_reboots:
+        description:
+            - Max number of switches rebooted at the same time.
+        default: 1
+        required: false
+    max_failures:
+        description:
+            - Number of failed switches tolerated before the remaining
+              waves are skipped.
+        default: 0
+        required: false
+    state_file:
+        description:
+            - File where the state of each switch is kept between runs.
+              Switches already upgraded, or downloaded, with the same
+              file_url are not upgraded, or downloaded, again.
+        required: false
+    copy_timeout:
+        description:
+            - Max time in seconds to wait for the image copy of a switch.
+        default: 600
+        required: false
+    boot_timeout:
+        description:
+            - Max time in seconds to wait for a switch to come back after
+              the reboot.
+        default: 300
+        required: false
+
+author:
+    - Ashish Pant (@hpe)
+'''
+
+EXAMPLES = '''
+      - name: rolling upgrade
+        arubaoss_firmware_upgrade:
+          switches:
+            - 192.168.1.11
+            - 192.168.1.12
+            - host: 192.168.1.13
+              port: 8080
+          file_url: "http://192.168.1.2/WC_16_07_REL_XANADU_QA_062618.swi"
+          firmware_version: WC.16.07.0003
+          max_downloads: 2
+          max_reboots: 1
+          state_file: ~/.ansible/upgrade_state.json
+        run_once: true
+
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.six import string_types
+from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec, arubaoss_required_if
+from ansible.module_utils.network.arubaoss.arubaoss import Aossapi, HostModule
+from ansible.module_utils.network.arubaoss.arubaoss import FileCache, load_params
+from ansible.module_utils.network.arubaoss.arubaoss import clear_api_version, parallel_map
+from time import time
+
+SWITCH_KEYS = ('host', 'port', 'username', 'use_ssl', 'api_version')
+
+
+class UpgradeState:
+    '''
+    State of each switch of the upgrade, kept in memory or in the
+    state_file. A state recorded for another file_url is ignored.
+    '''
+
+    def __init__(self, path, file_url, size):
+        self._file_url = file_url
+        self._cache = None
+        self._states = {}
+        if path:
+            self._cache = FileCache(path, max_entries=max(size, 256))
+
+    def get(self, host):
+        if self._cache:
+            state = self._cache.get(host)
+        else:
+            state = self._states.get(host)
+        if state and state.get('file_url') == self._file_url:
+            return state['status']
+        return 'pending'
+
+    def put(self, host, status):
+        state = {'status': status, 'file_url': self._file_url}
+        if self._cache:
+            self._cache.put(host, state)
+        else:
+            self._states[host] = state
+
+
+def switch_params(switch):
+    if isinstance(switch, string_types):
+        return {'host': switch}
+    return dict((key, value) for key, value in switch.items()
+                if key in SWITCH_KEYS and value is not None)
+
+
+def connect(module, switch):
+    '''Returns a REST connection of its own to switch'''
+    host_module = HostModule(module, switch)
+    cookie = load_params(host_module, keep_session=True)
+    return host_module, Aossapi(host_module, cookie=cookie)
+
+
+def download(module, switch, states):
+    params = module.params
+    host = switch['host']
+    result = {'status': states.get(host)}
+    if result['status'] in ('downloaded', 'done'):
+        return result
+
+    start = time()
+    try:
+        host_module, conn = connect(module, switch)
+        if params['firmware_version']:
+            if conn.get_firmware() == params['firmware_version']:
+                result['status'] = 'done'
+                result['msg'] = 'Already running firmware.'
+                states.put(host, 'done')
+                return result
+
+        data = {
+                'file_type': 'FTT_FIRMWARE',
+                'action': 'FTA_DOWNLOAD',
+                'url': params['file_url'],
+                'boot_image': params['boot_image'],
+                }
+        response = conn.run_commands('/file-transfer', data, 'POST')
+        message = response.get('body') or None
+        if message and 'Another download is in progress' in message:
+            status = 'Another download is in progress'
+        else:
+            status = conn.wait_for_transfer(params['copy_timeout'])
+    except Exception as err:
+        status = str(err)
+
+    result['total_time'] = int(time() - start)
+    if status == 'FTS_COMPLETED':
+        # New firmware may support another api version
+        clear_api_version(host_module)
+        result['status'] = 'downloaded'
+        result['msg'] = 'image transfer successful.'
+    else:
+        result['status'] = 'failed'
+        result['msg'] = 'image transfer failed with code: ' + status
+    states.put(host, result['status'])
+
+    return result
+
+
+def reboot(module, switch, states):
+    params = module.params
+    host = switch['host']
+    result = {}
+
+    start = time()
+    firmware, stages = None, {}
+    try:
+        host_module, conn = connect(module, switch)
+        response = conn.run_commands('/system/reboot',
+                                     {'boot_image': params['boot_image']}, 'reboot')
+        clear_api_version(host_module)
+        if response.get('message') == 'Device is rebooting':
+            firmware, stages = conn.wait_for_boot(params['boot_timeout'])
+    except Exception as err:
+        result['msg'] = str(err)
+
+    result['total_time'] = int(time() - start)
+    result['stages'] = stages
+    if not firmware:
+        result['status'] = 'failed'
+        result.setdefault('msg', 'Device reboot failed.')
+    elif params['firmware_version'] and firmware != params['firmware_version']:
+        result['status'] = 'failed'
+        result['msg'] = 'Device is running firmware ' + firmware
+    else:
+        result['status'] = 'done'
+        result['msg'] = 'Device reboot successful.'
+    result['firmware_version'] = firmware
+    states.put(host, result['status'])
+
+    return result
+
+
+def upgrade(module):
+
+    params = module.params
+    switches = [switch_params(switch) for switch in params['switches']]
+    states = UpgradeState(params['state_file'], params['file_url'], len(switches))
+    changed = False
+
+    results = parallel_map(lambda switch: download(module, switch, states),
+                           switches, workers=params['max_downloads'])
+    hosts = dict((switch['host'], result) for switch, result in zip(switches, results))
+    failures = len([result for result in results if result['status'] == 'failed'])
+
+    waiting = [switch for switch in switches
+               if hosts[switch['host']]['status'] == 'downloaded']
+    size = max(params['max_reboots'], 1)
+    for index in range(0, len(waiting), size):
+        wave = waiting[index:index + size]
+        if failures > params['max_failures']:
+            for switch in wave:
+                hosts[switch['host']]['msg'] = 'Not rebooted, too many failures.'
+            continue
+
+        results = parallel_map(lambda switch: reboot(module, switch, states),
+                               wave, workers=size)
+        for switch, result in zip(wave, results):
+            hosts[switch['host']].update(result)
+            if result['status'] == 'failed':
+                failures += 1
+            else:
+                changed = True
+
+    result = {'changed': changed, 'switches': hosts}
+    if failures > params['max_failures']:
+        result['failed'] = True
+        result['msg'] = 'Upgrade stopped, {} switches failed.'.format(failures)
+    else:
+        result['msg'] = 'Upgrade completed.'
+
+    return result
+
+
+def run_module():
+    module_args = dict(
+        switches=dict(type='list', required=True),
+        file_url=dict(type='str', required=True),
+        boot_image=dict(type='str', required=False, default='BI_PRIMARY_IMAGE',
+            choices=['BI_PRIMARY_IMAGE','BI_SECONDARY_IMAGE']),
+        firmware_version=dict(type='str', required=False),
+        max_downloads=dict(type='int', required=False, default=4),
+        max_reboots=dict(type='int', required=False, default=1),
+        max_failures=dict(type='int', required=False, default=0),
+        state_file=dict(type='path', required=False),
+        copy_timeout=dict(type='int', required=False, default=600),
+        boot_timeout=dict(type='int', required=False, default=300),
+    )
+
+    module_args.update(arubaoss_argument_spec)
+
+    result = dict(changed=False,warnings='Not Supported')
+
+    module = AnsibleModule(
+        required_if=arubaoss_required_if,
+        argument_spec=module_args,
+        supports_check_mode=True
+    )
+
+    # Items of switches are not no_log, so they must not hold a password
+    for switch in module.params['switches']:
+        if isinstance(switch, dict) and 'password' in switch:
+            module.fail_json(msg='A password of switches would be logged, use the password argument instead.')
+
+    if module.check_mode:
+        module.exit_json(**result)
+
+    try:
+        result = upgrade(module)
+    except Exception as err:
+        return module.fail_json(msg=err)
+
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+if __name__ == '__main__':
+    main()
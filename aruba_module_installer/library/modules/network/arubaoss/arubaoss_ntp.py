@@ -467,7 +467,8 @@ def config_ntp_keyId(module):
             url = check_url
             method = "PUT"
     # This will fail if key-id exists already, looking into a try/except
-    result = run_commands(module, url, data, method, check=check_url)
+    result = run_commands(module, url, data, method, check=check_url,
+                          state=check_presence or None)
     return result
 
 
@@ -168,7 +168,8 @@ def config_poe_port(module):
             break
 
     if diffSeen:
-        result = run_commands(module, url, data, method, check=url)
+        result = run_commands(module, url, data, method, check=url,
+                              state=newdata)
         return result
     else:
         return {'msg': 'Already Configured',
@@ -211,7 +212,8 @@ def config_poe_slot(module):
             break
 
     if diffSeen:
-        result = run_commands(module, url, data, method, check=url)
+        result = run_commands(module, url, data, method, check=url,
+                              state=newdata)
         return result
     else:
         return {'msg': 'Already Configured',
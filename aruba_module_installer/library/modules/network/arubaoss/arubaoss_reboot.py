@@ -50,6 +50,14 @@ options:
         default: true
         choice: true, false
         required: false
+    boot_timeout:
+        description:
+            - Max time in seconds to wait for the device to come back.
+              The time spent in each stage of the boot detection (device
+              down, TCP port open, REST up, firmware read) is returned
+              in stages.
+        default: 300
+        required: false
 
 author:
     - Ashish Pant (@hpe)
@@ -64,27 +72,12 @@ EXAMPLES = '''
 '''
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.network.arubaoss.arubaoss import run_commands,get_config
+from ansible.module_utils.network.arubaoss.arubaoss import run_commands
 from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec, arubaoss_required_if
 from ansible.module_utils.network.arubaoss.arubaoss import get_firmware
-from time import sleep, time
-
-
-def wait_for_boot(module):
-
-    url = '/system/status'
-    wait = 1
-
-    msg_queue = []
-    while wait <= 60:
-        result = get_config(module, url, check_login=False)
-        if result:
-            return result
-
-        sleep(5)
-        wait += 1
-
-    return False
+from ansible.module_utils.network.arubaoss.arubaoss import clear_api_version
+from ansible.module_utils.network.arubaoss.arubaoss import wait_for_boot
+from time import time
 
 
 def reboot(module):
@@ -104,17 +97,22 @@ def reboot(module):
     result = run_commands(module, url, data, 'reboot')
     total_time = 0
 
+    # Device may come up with another image, discover api version again
+    clear_api_version(module)
+
     if result['message'] == 'Device is rebooting' and params['is_wait']:
         start = time()
-        result  = wait_for_boot(module)
+        firmware, stages = wait_for_boot(module, params['boot_timeout'])
 
         end = time()
         total_time = int(end-start)
 
-        if result:
-            result = {'changed':True,'msg': 'Device reboot successful.','total_time':total_time}
+        if firmware:
+            result = {'changed':True,'msg': 'Device reboot successful.','total_time':total_time,
+                      'firmware_version': firmware, 'stages': stages}
         else:
-            result = {'failed': True,'msg': 'Device reboot failed.','total_time': total_time}
+            result = {'failed': True,'msg': 'Device reboot failed.','total_time': total_time,
+                      'stages': stages}
 
 
 
@@ -125,7 +123,8 @@ def run_module():
     module_args = dict(
         boot_image=dict(type='str', required=False, default='BI_PRIMARY_IMAGE',
             choices=['BI_PRIMARY_IMAGE','BI_SECONDARY_IMAGE']),
-        is_wait=dict(type='bool', required=False, default=True)
+        is_wait=dict(type='bool', required=False, default=True),
+        boot_timeout=dict(type='int', required=False, default=300),
     )
 
     module_args.update(arubaoss_argument_spec)
@@ -46,8 +46,37 @@ options:
         choices: create, delete
         required: False
     vlan_id:
-        description: vlan id to be configured
-        required: true
+        description: vlan id to be configured. Required unless vlans or
+        port_vlans is given.
+        required: false
+    vlans:
+        description: List of vlans to be configured in a single task, used
+        with command config_vlan instead of vlan_id. Each item takes vlan_id
+        and optionally name, status, vlantype, is_jumbo_enabled,
+        is_voice_enabled, is_dsnoop_enabled, is_dhcp_server_enabled,
+        is_management_vlan and config (defaults to the config option).
+        Existing vlans are read once and only the vlans which need to be
+        created, updated or deleted are sent to the switch. Options not
+        given in an item are left unchanged on existing vlans.
+        required: false
+    purge:
+        description: With vlans, delete the vlans present on the switch but
+        not in the list. Vlan 1 and the management vlan are never deleted.
+        required: false
+        default: false
+    port_vlans:
+        description: Desired vlan membership of ports, used with command
+        config_vlan_port instead of vlan_id and port_id. Keys are port ids,
+        values take untagged (a vlan id), tagged and forbidden (lists of
+        vlan ids). Memberships are read once and only the ones which
+        differ are sent. Memberships of a listed port which are not given
+        are removed.
+        required: false
+    workers:
+        description: Number of ports reconciled in parallel with port_vlans.
+        Set http_pool_size to the same value to keep all connections alive.
+        required: false
+        default: 1
     name:
         description: Name of the VLAN. While creating a Vlan If name is given
         as empty string, default value (VLANx, where x is the vlan_id) will be
@@ -164,6 +193,29 @@ EXAMPLES = '''
          config: "create"
          command: config_vlan
 
+      - name: configure a set of vlans in one task
+        arubaoss_vlan:
+          command: config_vlan
+          vlans:
+            - vlan_id: 10
+              name: "users"
+            - vlan_id: 20
+              name: "voice"
+              is_voice_enabled: true
+            - vlan_id: 30
+              config: "delete"
+
+      - name: set the vlan membership of ports
+        arubaoss_vlan:
+          command: config_vlan_port
+          workers: 4
+          port_vlans:
+            "1":
+              untagged: 10
+              tagged: [20, 30]
+            "2":
+              untagged: 10
+
       - name: Configure igmp and its parameters for VLAN 2
         arubaoss_vlan:
           vlan_id: 2
@@ -187,6 +239,7 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.network.arubaoss.arubaoss import run_commands
 from ansible.module_utils.network.arubaoss.arubaoss import get_config
 from ansible.module_utils.network.arubaoss.arubaoss import get_firmware
+from ansible.module_utils.network.arubaoss.arubaoss import parallel_map, ArubaossError
 from ansible.module_utils.network.arubaoss.arubaoss import arubaoss_argument_spec, arubaoss_required_if
 from ansible.module_utils._text import to_text
 import json
@@ -333,6 +386,130 @@ def config_vlan_port(module):
         result = run_commands(module, url, data, method, check=del_url)
         return result
 
+# port_vlans keys and the matching port mode
+PORT_MODES = {
+    'untagged': 'POM_UNTAGGED',
+    'tagged': 'POM_TAGGED_STATIC',
+    'forbidden': 'POM_FORBIDDEN',
+}
+
+"""
+-------
+Name: config_vlan_ports
+
+Reconciles the VLAN membership of the ports given in port_vlans. The
+VLANs and memberships present on the switch are read once and only the
+memberships which differ are sent, ports being handled in parallel by
+up to workers threads.
+
+param request: module
+
+Returns
+ Configure the switch with params sent, with the result per membership
+-------
+"""
+def config_vlan_ports(module):
+
+    params = module.params
+
+    desired = {}
+    for port_id, modes in params['port_vlans'].items():
+        if not isinstance(modes, dict):
+            return {'msg': "port_vlans value of port {} must be a dict".format(port_id),
+                    'changed': False, 'failed': True}
+        unknown = set(modes) - set(PORT_MODES)
+        if unknown:
+            return {'msg': "Unsupported options for port {}: {}".format(
+                        port_id, ', '.join(sorted(unknown))),
+                    'changed': False, 'failed': True}
+
+        memberships = {}
+        for mode, port_mode in PORT_MODES.items():
+            vlan_ids = modes.get(mode)
+            if vlan_ids is None:
+                continue
+            if not isinstance(vlan_ids, list):
+                vlan_ids = [vlan_ids]
+            if mode == 'untagged' and len(vlan_ids) > 1:
+                return {'msg': "Port {} can be untagged in one vlan only".format(port_id),
+                        'changed': False, 'failed': True}
+            for vlan_id in vlan_ids:
+                memberships[int(vlan_id)] = port_mode
+        desired[str(port_id)] = memberships
+
+    vlans = set()
+    vlan_config = get_config(module, "/vlans")
+    if vlan_config:
+        for element in module.from_json(to_text(vlan_config))['vlan_element']:
+            vlans.add(element['vlan_id'])
+
+    current = {}
+    port_config = get_config(module, "/vlans-ports")
+    if port_config:
+        for element in module.from_json(to_text(port_config))['vlan_port_element']:
+            current.setdefault(element['port_id'], {})[element['vlan_id']] = element['port_mode']
+
+    def reconcile_port(port_id):
+        want = desired[port_id]
+        have = current.get(port_id, {})
+        results = []
+
+        # Adds and mode changes go first, the untagged vlan leading: the
+        # switch moves the port out of its old untagged vlan by itself.
+        for vlan_id in sorted(want, key=lambda vlan: (want[vlan] != 'POM_UNTAGGED', vlan)):
+            port_mode = want[vlan_id]
+            result = {'port_id': port_id, 'vlan_id': vlan_id, 'port_mode': port_mode}
+            if vlan_id not in vlans:
+                result.update(action='none', changed=False, failed=True,
+                              msg='Cannot configure ports without Vlan configured')
+                results.append(result)
+                continue
+            if have.get(vlan_id) == port_mode:
+                continue
+
+            data = {'vlan_id': vlan_id, 'port_id': port_id, 'port_mode': port_mode}
+            if vlan_id in have:
+                url = "/vlans-ports/" + str(vlan_id) + "-" + port_id
+                result['action'] = 'update'
+                response = run_commands(module, url, data, 'PUT')
+            else:
+                result['action'] = 'create'
+                response = run_commands(module, '/vlans-ports', data, 'POST')
+            result.update(changed=bool(response.get('changed')),
+                          failed=bool(response.get('failed')))
+            if result['failed']:
+                result['msg'] = response.get('msg')
+            results.append(result)
+
+        moved_untagged = 'POM_UNTAGGED' in want.values()
+        for vlan_id in sorted(set(have) - set(want)):
+            if moved_untagged and have[vlan_id] == 'POM_UNTAGGED':
+                continue
+            url = "/vlans-ports/" + str(vlan_id) + "-" + port_id
+            response = run_commands(module, url, {}, 'DELETE')
+            result = {'port_id': port_id, 'vlan_id': vlan_id,
+                      'port_mode': have[vlan_id], 'action': 'delete',
+                      'changed': bool(response.get('changed')),
+                      'failed': bool(response.get('failed'))}
+            if result['failed']:
+                result['msg'] = response.get('msg')
+            results.append(result)
+
+        return results
+
+    results = []
+    try:
+        port_results = parallel_map(reconcile_port, sorted(desired),
+                                    workers=params['workers'])
+    except ArubaossError as err:
+        module.fail_json(msg=str(err))
+    for port_result in port_results:
+        results.extend(port_result)
+
+    return {'changed': any(result['changed'] for result in results),
+            'failed': any(result.get('failed') for result in results),
+            'port_vlans': results}
+
 # Add dhcp helper address to vlan
 """
 -------
@@ -445,6 +622,126 @@ def config_vlan(module):
     return result
 
 
+# Options of a vlans item and the matching REST attribute
+VLAN_ATTRIBUTES = {
+    'name': 'name',
+    'status': 'status',
+    'vlantype': 'type',
+    'is_jumbo_enabled': 'is_jumbo_enabled',
+    'is_voice_enabled': 'is_voice_enabled',
+    'is_dsnoop_enabled': 'is_dsnoop_enabled',
+    'is_dhcp_server_enabled': 'is_dhcp_server_enabled',
+    'is_management_vlan': 'is_management_vlan',
+}
+
+"""
+-------
+Name: config_vlans
+
+Configures the list of VLANs given in vlans. The VLANs present on the
+switch are read once, the create/update/delete set is computed locally
+and only the differences are sent.
+
+param request: module
+
+Returns
+ Configure the switch with params sent, with the result per VLAN
+-------
+"""
+def config_vlans(module):
+
+    params = module.params
+
+    desired = {}
+    for vlan in params['vlans']:
+        if not isinstance(vlan, dict) or not vlan.get('vlan_id'):
+            return {'msg': "Each item in vlans needs a vlan_id",
+                    'changed': False, 'failed': True}
+        unknown = set(vlan) - set(VLAN_ATTRIBUTES) - set(['vlan_id', 'config'])
+        if unknown:
+            return {'msg': "Unsupported options for vlan {}: {}".format(
+                        vlan['vlan_id'], ', '.join(sorted(unknown))),
+                    'changed': False, 'failed': True}
+        config = vlan.get('config') or params['config']
+        if config not in ('create', 'delete'):
+            return {'msg': 'Valid config options are : create and delete',
+                    'changed': False, 'failed': True}
+        desired[int(vlan['vlan_id'])] = (config, vlan)
+
+    firmware = get_firmware(module)
+    dhcp_server_supported = firmware[:2] not in ("YA", "YB")
+
+    current = {}
+    vlan_config = get_config(module, "/vlans")
+    if vlan_config:
+        for element in module.from_json(to_text(vlan_config))['vlan_element']:
+            current[element['vlan_id']] = element
+
+    results = []
+    for vlan_id in sorted(desired):
+        config, vlan = desired[vlan_id]
+        present = current.get(vlan_id)
+
+        if config == 'delete':
+            if not present:
+                results.append({'vlan_id': vlan_id, 'action': 'none',
+                                'changed': False, 'msg': 'Not present'})
+                continue
+            action, url, method, data = 'delete', "/vlans/" + str(vlan_id), 'DELETE', {}
+
+        else:
+            data = {'vlan_id': vlan_id}
+            if not dhcp_server_supported and vlan.get('is_dhcp_server_enabled'):
+                results.append({'vlan_id': vlan_id, 'action': 'none',
+                                'changed': False, 'failed': True,
+                                'msg': "option : is_dhcp_server_enabled is not supported on this platform"})
+                continue
+
+            if present:
+                for option, key in VLAN_ATTRIBUTES.items():
+                    if option in vlan and vlan[option] != present.get(key):
+                        data[key] = vlan[option]
+                if len(data) == 1:
+                    results.append({'vlan_id': vlan_id, 'action': 'none',
+                                    'changed': False})
+                    continue
+                action, url, method = 'update', "/vlans/" + str(vlan_id), 'PUT'
+
+            else:
+                for option, key in VLAN_ATTRIBUTES.items():
+                    data[key] = vlan.get(option, params[option])
+                if not vlan.get('name'):
+                    data['name'] = "VLAN{}".format(vlan_id)
+                action, url, method = 'create', "/vlans", 'POST'
+
+            if not dhcp_server_supported:
+                data.pop('is_dhcp_server_enabled', None)
+
+        response = run_commands(module, url, data, method)
+        result = {'vlan_id': vlan_id, 'action': action,
+                  'changed': bool(response.get('changed')),
+                  'failed': bool(response.get('failed'))}
+        if result['failed']:
+            result['msg'] = response.get('msg')
+        results.append(result)
+
+    if params['purge']:
+        for vlan_id in sorted(set(current) - set(desired)):
+            if vlan_id == 1 or current[vlan_id].get('is_management_vlan'):
+                continue
+            response = run_commands(module, "/vlans/" + str(vlan_id), {}, 'DELETE')
+            result = {'vlan_id': vlan_id, 'action': 'delete',
+                      'changed': bool(response.get('changed')),
+                      'failed': bool(response.get('failed'))}
+            if result['failed']:
+                result['msg'] = response.get('msg')
+            results.append(result)
+
+    return {'changed': any(result['changed'] for result in results),
+            'failed': any(result.get('failed') for result in results),
+            'vlans': results}
+
+
 def config_qos(module):
 
     params = module.params
@@ -591,7 +888,11 @@ def run_module():
                 'config_vlan_qos','config_vlan_acl', 'config_vlan_igmp']),
         config=dict(type='str', required=False, default= "create",
                choices=["create","delete"]),
-        vlan_id=dict(type='int', required=True),
+        vlan_id=dict(type='int', required=False),
+        vlans=dict(type='list', required=False),
+        purge=dict(type='bool', required=False, default=False),
+        port_vlans=dict(type='dict', required=False),
+        workers=dict(type='int', required=False, default=1),
         name=dict(type='str', required=False, default=""),
         ip_address_mode=dict(type='str', required=False, default="IAAM_STATIC",
            choices = ['IAAM_DISABLED', 'IAAM_STATIC', 'IAAM_DHCP']),
@@ -633,6 +934,8 @@ def run_module():
 
     module = AnsibleModule(
         required_if=arubaoss_required_if,
+        required_one_of=[['vlan_id', 'vlans', 'port_vlans']],
+        mutually_exclusive=[['vlan_id', 'vlans', 'port_vlans']],
         argument_spec=module_args,
         supports_check_mode=True
     )
@@ -640,13 +943,24 @@ def run_module():
     if module.check_mode:
         module.exit_json(**result)
 
+    if module.params['vlans'] and module.params['command'] != "config_vlan":
+        module.fail_json(msg="vlans is only supported with command config_vlan")
+    if module.params['port_vlans'] and module.params['command'] != "config_vlan_port":
+        module.fail_json(msg="port_vlans is only supported with command config_vlan_port")
+
     try:
         if module.params['command'] == "config_vlan":
-            result = config_vlan(module)
+            if module.params['vlans']:
+                result = config_vlans(module)
+            else:
+                result = config_vlan(module)
         elif module.params['command'] == "config_vlan_dhcpHelperAddress":
             result = config_vlan_dhcpHelperAddress(module)
         elif module.params['command'] == "config_vlan_port":
-            result = config_vlan_port(module)
+            if module.params['port_vlans']:
+                result = config_vlan_ports(module)
+            else:
+                result = config_vlan_port(module)
         elif module.params['command'] == 'config_vlan_qos':
             result = config_qos(module)
         elif module.params['command'] == 'config_vlan_acl':
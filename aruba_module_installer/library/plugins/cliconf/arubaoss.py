@@ -18,14 +18,23 @@ version_added: "2.9"
 
 import json
 import re
+import socket
+import time
 from itertools import chain
 
 from ansible.errors import AnsibleConnectionFailure
-from ansible.module_utils._text import to_text
+from ansible.module_utils._text import to_bytes, to_text
 from ansible.module_utils.common._collections_compat import Mapping
 from ansible.module_utils.network.common.utils import to_list
 from ansible.plugins.cliconf import CliconfBase, enable_mode
 
+# Longer lines may be wrapped in the echo of the device, they are sent
+# one at a time in batch mode.
+MAX_BATCH_LINE = 79
+
+# Commands which leave the configuration as it is
+READ_ONLY_RE = re.compile(r'^\s*(show|sh|ping|traceroute)\b', re.I)
+
 
 class Cliconf(CliconfBase):
     '''
@@ -37,6 +46,7 @@ class Cliconf(CliconfBase):
         init function
         '''
         super(Cliconf, self).__init__(*args, **kwargs)
+        self._cache = dict()
 
     @enable_mode
     def get_config(self, source='running', format='text', flags=None):
@@ -57,6 +67,7 @@ class Cliconf(CliconfBase):
         '''
         Edit the switch config
         '''
+        self._cache.clear()
         for cmd in chain(['configure terminal'], to_list(command), ['end']):
             self.send_command(cmd)
 
@@ -69,6 +80,27 @@ class Cliconf(CliconfBase):
                                  sendonly=sendonly, newline=newline,
                                  check_all=check_all)
 
+    def get_cached(self, command, max_age):
+        '''
+        Returns the output of a show command, reusing the output read by
+        this connection, e.g. for a previous task, in the last max_age
+        seconds. Any other command run through run_commands or
+        edit_config, or clear_cache, drops the outputs kept so far.
+        '''
+        entry = self._cache.get(command)
+        if entry and time.time() - entry[0] < max_age:
+            return {'output': entry[1], 'cached': True}
+
+        output = to_text(self.send_command(command), errors='surrogate_or_strict')
+        self._cache[command] = (time.time(), output)
+        return {'output': output, 'cached': False}
+
+    def clear_cache(self):
+        '''
+        Drops the outputs kept by get_cached
+        '''
+        self._cache.clear()
+
     def get_device_info(self):
         '''
         Get device info
@@ -103,18 +135,40 @@ class Cliconf(CliconfBase):
         result = super(Cliconf, self).get_capabilities()
         return json.dumps(result)
 
-    def run_commands(self, commands=None, check_rc=False):
+    def run_commands(self, commands=None, check_rc=False, batch_size=1):
         '''
-        Run commands on the switch
+        Run commands on the switch. With batch_size above 1, up to
+        batch_size plain commands are written at once and their output is
+        read in one go, instead of waiting for the prompt after each
+        command. With check_rc, an error stops the run but the remaining
+        commands of its batch were already sent.
         '''
         if commands is None:
             raise ValueError("'commands' value is required")
+        if batch_size > 1 and self._batch_channel() is None:
+            batch_size = 1
         responses = list()
+        batch = list()
         for cmd in to_list(commands):
 
             if not isinstance(cmd, Mapping):
                 cmd = {'command': cmd}
 
+            if not READ_ONLY_RE.match(cmd['command']):
+                self._cache.clear()
+
+            if (batch_size > 1 and list(cmd) == ['command'] and
+                    0 < len(cmd['command'].strip()) <= MAX_BATCH_LINE):
+                batch.append(cmd['command'])
+                if len(batch) == batch_size:
+                    responses.extend(self._run_batch(batch, check_rc))
+                    batch = list()
+                continue
+
+            if batch:
+                responses.extend(self._run_batch(batch, check_rc))
+                batch = list()
+
             try:
                 out = self.send_command(**cmd)
             except AnsibleConnectionFailure as exception:
@@ -127,8 +181,100 @@ class Cliconf(CliconfBase):
 
             responses.append(out)
 
+        if batch:
+            responses.extend(self._run_batch(batch, check_rc))
+
+        return responses
+
+    def _batch_channel(self):
+        '''
+        Returns the shell channel, the output cleanup function and the
+        terminal plugin of the network_cli connection, or None when they
+        are not available. Batching writes to and reads from the channel
+        directly, bypassing the receive loop of network_cli, and this is
+        the only place relying on its private attributes: _ssh_shell,
+        _strip and _terminal as found in Ansible 2.5 to 2.9. Without them
+        commands are sent one at a time through send_command.
+        '''
+        try:
+            shell = self._connection._ssh_shell
+            strip = self._connection._strip
+            terminal = self._connection._terminal
+        except AttributeError:
+            return None
+        if shell is None or terminal is None:
+            return None
+        return shell, strip, terminal
+
+    def _run_batch(self, commands, check_rc):
+        '''
+        Runs commands in one round trip and checks the output of each of
+        them against terminal_stderr_re
+        '''
+        terminal = self._batch_channel()[2]
+        responses = list()
+        for command, out in zip(commands, self._send_batch(commands)):
+            if check_rc:
+                for regex in terminal.terminal_stderr_re:
+                    if regex.search(out):
+                        raise AnsibleConnectionFailure(
+                            "command '{}' failed: {}".format(
+                                command, to_text(out, errors='surrogate_or_strict')))
+            responses.append(to_text(out, errors='surrogate_or_strict'))
         return responses
 
+    def _send_batch(self, commands):
+        '''
+        Writes commands at once and reads until the device echoed all of
+        them and shows its prompt again. Returns the output of each
+        command, i.e. the lines between its echo and the next prompt.
+        The channel keeps the command timeout network_cli set on it.
+        '''
+        shell, strip, terminal = self._batch_channel()
+        shell.sendall(to_bytes('\r'.join(commands) + '\r',
+                               errors='surrogate_or_strict'))
+
+        data = b''
+        while True:
+            try:
+                chunk = shell.recv(4096)
+            except socket.timeout:
+                raise AnsibleConnectionFailure(
+                    "timeout waiting for the output of '{}'".format(commands[-1]))
+            if not chunk:
+                raise AnsibleConnectionFailure(
+                    "connection closed while running '{}'".format(commands[-1]))
+            data += chunk
+            outputs = self._split_batch(strip(data), commands, terminal)
+            if outputs is not None:
+                return outputs
+
+    def _split_batch(self, data, commands, terminal):
+        '''
+        Splits the output of a batch on the echo of each command, or
+        returns None while the output is not complete
+        '''
+        lines = data.replace(b'\r', b'').split(b'\n')
+        outputs = list()
+        index = 0
+        for line in lines[:-1]:
+            if index < len(commands):
+                echo = to_bytes(commands[index].strip(), errors='surrogate_or_strict')
+                prompt = line.rstrip()[:-len(echo)]
+                if (line.rstrip().endswith(echo) and
+                        any(regex.search(prompt) for regex in terminal.terminal_stdout_re)):
+                    outputs.append(list())
+                    index += 1
+                    continue
+            if outputs:
+                outputs[-1].append(line)
+
+        if index < len(commands):
+            return None
+        if not any(regex.search(lines[-1]) for regex in terminal.terminal_stdout_re):
+            return None
+        return [b'\n'.join(output).strip() for output in outputs]
+
     def set_cli_prompt_context(self):
         """
         Make sure we are in the operational cli mode
@@ -132,14 +132,45 @@ options:
         key: command_timeout
     env:
       - name: ANSIBLE_PERSISTENT_COMMAND_TIMEOUT
+  session_idle_timeout:
+    type: int
+    description:
+      - Time in seconds after which an idle REST session is assumed to be
+        expired on the switch and is logged in again before the next
+        request. A request answered with a 401 is always replayed once
+        after logging in again.
+    default: 600
+    vars:
+      - name: ansible_httpapi_session_idle_timeout
+  request_retries:
+    type: int
+    description:
+      - Number of times a REST request is retried when the switch cannot
+        be reached or answers with a 502, 503 or 504.
+    default: 3
+    vars:
+      - name: ansible_httpapi_request_retries
+  retry_backoff:
+    type: float
+    description:
+      - Delay in seconds before the first retry of a request, doubled at
+        each following retry.
+    default: 1
+    vars:
+      - name: ansible_httpapi_retry_backoff
 """
 
 import os
+import re
+import json
+import time
 import requests
 from ansible import constants as c
+from ansible.errors import AnsibleConnectionFailure
 from ansible.module_utils._text import to_bytes
-from ansible.module_utils.six import PY3
+from ansible.module_utils.six import PY3, iteritems
 from ansible.module_utils.six.moves import cPickle
+from ansible.module_utils.six.moves.urllib.parse import unquote
 from ansible.playbook.play_context import PlayContext
 from ansible.plugins.loader import connection_loader
 from ansible.plugins.connection import ConnectionBase
@@ -151,6 +182,183 @@ except ImportError:
     from ansible.utils.display import Display
     display = Display()
 
+# Status codes of the transient errors a request is retried on
+RETRY_STATUS = (502, 503, 504)
+
+# REST tables kept at the top level of the full running-config instead of
+# under System
+TOP_LEVEL_TABLES = {'interfaces': 'Interface', 'ports': 'Port'}
+
+
+def merge_config(current, desired):
+    '''
+    Returns current updated with desired, a partial configuration, merging
+    the objects present in both
+    '''
+    if not isinstance(current, dict) or not isinstance(desired, dict):
+        return desired
+    merged = dict(current)
+    for key, value in iteritems(desired):
+        merged[key] = merge_config(current.get(key), value)
+    return merged
+
+
+def json_patch(old, new, path=''):
+    '''
+    Returns the JSON patch, a list of RFC 6902 add, remove and replace
+    operations, turning old into new
+    '''
+    if old is None:
+        return [{'op': 'add', 'path': path, 'value': new}]
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        if old == new:
+            return []
+        return [{'op': 'replace', 'path': path, 'value': new}]
+
+    patch = []
+    for key in old:
+        if key not in new:
+            patch.append({'op': 'remove', 'path': _pointer(path, key)})
+    for key, value in iteritems(new):
+        if key not in old:
+            patch.append({'op': 'add', 'path': _pointer(path, key), 'value': value})
+        else:
+            patch.extend(json_patch(old[key], value, _pointer(path, key)))
+    return patch
+
+
+def _pointer(path, key):
+    return '%s/%s' % (path, str(key).replace('~', '~0').replace('/', '~1'))
+
+
+_JSON_TOKEN_RE = re.compile(r'["{}\[\],:]')
+_JSON_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+_JSON_LITERAL_RE = re.compile(r'[^\s,}\]]+')
+# Text up to the next bracket outside of strings
+_JSON_SKIP_RE = re.compile(r'(?:[^"{}\[\]]+|"(?:[^"\\]|\\.)*")*')
+
+
+def iter_json_members(chunks, path):
+    '''
+    Parses a JSON document received in chunks and yields (key, value) for
+    each member of the object at path, a list of keys. A member is
+    decoded once it is complete, and values off the path are skipped
+    bracket to bracket without being decoded, so only one member is held
+    in memory at a time. The members share their key strings, as they
+    would in a single json.loads of the document.
+    '''
+    path = list(path)
+    names = {}
+    decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: dict(
+        (names.setdefault(name, name), item) for name, item in pairs))
+    buf = ''
+    pos = 0
+    # Open objects leading to path, as [key in the parent, expecting a key]
+    stack = []
+    key = None
+    # Value after the current key: 'capture', 'skip' or None to go down path
+    value = None
+    start = None
+    depth = 0
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            if depth:
+                pos = _JSON_SKIP_RE.match(buf, pos).end()
+                if pos >= len(buf) or buf[pos] == '"':
+                    # The value goes on in the next chunk
+                    break
+                depth += 1 if buf[pos] in '{[' else -1
+                pos += 1
+                if not depth:
+                    value = None
+                continue
+
+            if value:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos >= len(buf):
+                    break
+                start = pos
+                if buf[pos] in '{[':
+                    if value == 'capture':
+                        # An object or array only decodes once its closing
+                        # bracket was received
+                        try:
+                            member, pos = decoder.raw_decode(buf, pos)
+                        except ValueError:
+                            break
+                        yield key, member
+                        value = None
+                        continue
+                    depth = 1
+                    pos += 1
+                    continue
+                if buf[pos] == '"':
+                    match = _JSON_STRING_RE.match(buf, pos)
+                else:
+                    match = _JSON_LITERAL_RE.match(buf, pos)
+                if not match or match.end() >= len(buf):
+                    break
+                pos = match.end()
+                if value == 'capture':
+                    yield key, decoder.decode(buf[start:pos])
+                value = None
+                continue
+
+            match = _JSON_TOKEN_RE.search(buf, pos)
+            if not match:
+                pos = len(buf)
+                break
+            index = match.start()
+            token = match.group()
+            if token == '"':
+                string = _JSON_STRING_RE.match(buf, index)
+                if not string:
+                    pos = index
+                    break
+                pos = string.end()
+                if stack and stack[-1][1]:
+                    key = json.loads(string.group())
+                continue
+
+            pos = index + 1
+            if token == '{':
+                stack.append([key, True])
+            elif token == ':':
+                stack[-1][1] = False
+                start = pos
+                keys = [entry[0] for entry in stack[1:]]
+                if keys == path:
+                    value = 'capture'
+                elif keys + [key] != path[:len(keys) + 1]:
+                    value = 'skip'
+            elif token == ',':
+                stack[-1][1] = True
+            elif token == '}':
+                stack.pop()
+
+        # Drop the text scanned so far, but the value being captured
+        offset = start if value == 'capture' else pos
+        buf = buf[offset:]
+        pos -= offset
+        if value == 'capture':
+            start = 0
+
+
+def full_config_keys(path):
+    '''
+    Returns the keys of a REST resource in the full running-config, e.g.
+    ['System', 'vlans', '10'] for /system/vlans/10 and ['Interface',
+    '1/1/1'] for /system/interfaces/1%2F1%2F1
+    '''
+    segments = [unquote(segment) for segment in path.strip('/').split('/')]
+    if segments[0] != 'system' or len(segments) < 2:
+        raise AnsibleConnectionFailure('%s is not a resource of the running-config' % path)
+    if segments[1] in TOP_LEVEL_TABLES:
+        return [TOP_LEVEL_TABLES[segments[1]]] + segments[2:]
+    return ['System'] + segments[1:]
+
 
 class Connection(ConnectionBase):
     '''Network API connection'''
@@ -181,6 +389,11 @@ class Connection(ConnectionBase):
         # Construct URLs for interacting with the switch
         self._construct_urls()
 
+        # Time of the last response of the REST session
+        self._last_used = None
+        self._stats = {'requests': 0, 'retries': 0, 'logins': 0,
+                       'bytes_sent': 0, 'bytes_received': 0}
+
         # reconstruct the socket_path and set instance values accordingly
         self._update_connection_state()
 
@@ -190,6 +403,9 @@ class Connection(ConnectionBase):
         except KeyError:
             raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
 
+    def _rest_url(self, path):
+        return '%s://%s/rest/v1%s' % (self._protocol, self._remote_host, path)
+
     def _construct_urls(self):
         login_string = '/rest/v1/login'
         logout_string = '/rest/v1/logout'
@@ -228,17 +444,80 @@ class Connection(ConnectionBase):
         if self._connected:
             return
         display.vvvv("Opening the rest session now")
-        payload = {'action': 'login', 'username': self._username, 'password': self._password}
         self._http_session_handle = requests.session()
         self._http_session_handle.trust_env = False
-        response = self._http_session_handle.post(self._login_url, data=payload, verify=False)
-        display.vvvv("Login response")
-        display.vvvv(response.text)
+        self._login()
         display.vvvv("The session object is")
         display.vvvv("=== ======= ====== ==")
         display.vvvv(str(self._http_session_handle))
         self._connected = True
 
+    def _option(self, name, default):
+        try:
+            value = self.get_option(name)
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def _login(self):
+        '''
+        Logs in the REST session, keeping its pooled HTTP connections
+        '''
+        payload = {'action': 'login', 'username': self._username, 'password': self._password}
+        response = self._http_session_handle.post(self._login_url, data=payload, verify=False)
+        self._stats['logins'] += 1
+        display.vvvv("Login response")
+        display.vvvv(response.text)
+        if not response.ok:
+            raise AnsibleConnectionFailure('Login to %s failed: %s' % (self._remote_host, response.text))
+        self._last_used = time.time()
+
+    def _session_expired(self):
+        if self._last_used is None:
+            return False
+        idle_timeout = self._option('session_idle_timeout', 600)
+        return time.time() - self._last_used > idle_timeout
+
+    def _request(self, method, url, **kwargs):
+        '''
+        Sends a request on the REST session. An idle session is logged in
+        again first, a request answered with a 401 is replayed once after
+        logging in again, and transient errors are retried with backoff.
+        '''
+        kwargs.setdefault('verify', False)
+        retries = self._option('request_retries', 3)
+        backoff = self._option('retry_backoff', 1)
+        if self._session_expired():
+            display.vvvv('REST session idle, logging in again', host=self._remote_host)
+            self._login()
+
+        relogin = True
+        attempt = 0
+        while True:
+            self._stats['requests'] += 1
+            self._stats['bytes_sent'] += len(kwargs.get('data') or '')
+            try:
+                response = self._http_session_handle.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt >= retries:
+                    raise AnsibleConnectionFailure('%s %s failed: %s' % (method, url, err))
+            else:
+                self._last_used = time.time()
+                if response.status_code == 401 and relogin:
+                    display.vvvv('REST session expired, logging in again', host=self._remote_host)
+                    response.close()
+                    relogin = False
+                    self._login()
+                    continue
+                if response.status_code not in RETRY_STATUS or attempt >= retries:
+                    if not kwargs.get('stream'):
+                        self._stats['bytes_received'] += len(response.content)
+                    return response
+                response.close()
+            attempt += 1
+            self._stats['retries'] += 1
+            time.sleep(backoff * 2 ** (attempt - 1))
+
     def _update_connection_state(self):
         '''
         Reconstruct the connection socket_path and check if it exists
@@ -272,18 +551,198 @@ class Connection(ConnectionBase):
 
     def close(self):
         if self._connected:
-            response = self._http_session_handle.post(self._logout_url, verify=False)
+            session = self.__dict__.get('_http_session_handle')
+            if session and not self._session_expired():
+                # Nothing to log out of once the switch expired the session
+                try:
+                    response = session.post(self._logout_url, verify=False)
+                    display.vvvv(response.text)
+                except requests.RequestException as err:
+                    display.vvvv('Logout failed: %s' % err)
             display.debug("Hi! Closing the http connection now")
-            display.vvvv(response.text)
+            display.vvvv('REST session stats: %(requests)d requests, %(retries)d retries, '
+                         '%(logins)d logins, %(bytes_sent)d bytes sent, '
+                         '%(bytes_received)d bytes received' % self._stats, host=self._remote_host)
             display.display("Closed the http connection!")
             self._connected = False
 
     def get_running_config(self):
         if self._connected and self._http_session_handle:
-            response = self._http_session_handle.get(self._run_config_url, verify=False)
+            response = self._request('GET', self._run_config_url)
             return response.text
 
+    def iter_running_config(self, path=None, chunk_size=65536):
+        '''
+        Streams the full running-config and yields (key, value) for each
+        member of the object at path, a list of keys such as ['System',
+        'vlans'], or for each top-level section by default
+        '''
+        if self._connected and self._http_session_handle:
+            response = self._request('GET', self._run_config_url, stream=True)
+            response.encoding = 'utf-8'
+            chunks = response.iter_content(chunk_size, decode_unicode=True)
+            for item in iter_json_members(self._count_received(chunks), path or []):
+                yield item
+
+    def _count_received(self, chunks):
+        for chunk in chunks:
+            self._stats['bytes_received'] += len(chunk)
+            yield chunk
+
+    def get_running_config_section(self, path):
+        '''
+        Returns the object at path in the running-config, e.g.
+        ['System', 'vlans'] or ['Interface'], parsed while it is received
+        without holding the whole document
+        '''
+        return dict(self.iter_running_config(path))
+
     def put_running_config(self, updated_config):
         if self._connected and self._http_session_handle:
-            response = self._http_session_handle.put(self._run_config_url, data=updated_config, verify=False)
+            response = self._request('PUT', self._run_config_url, data=updated_config)
             return response.text
+
+    def _fullconfig_url(self, name):
+        return self._rest_url('/fullconfigs/%s' % name)
+
+    def _copy_config(self, source, target):
+        '''
+        Copies the configuration source to target, e.g. a checkpoint to
+        running-config, in one operation on the switch
+        '''
+        params = {'from': '/rest/v1/fullconfigs/%s' % source}
+        response = self._request('PUT', self._fullconfig_url(target), params=params)
+        return response.status_code in (200, 204), response.text
+
+    def _delete_checkpoint(self, name):
+        try:
+            response = self._request('DELETE', self._fullconfig_url(name))
+        except AnsibleConnectionFailure as err:
+            display.vvvv('Removing checkpoint %s failed: %s' % (name, err))
+            return
+        if response.status_code not in (200, 204, 404):
+            display.vvvv('Removing checkpoint %s failed: %s' % (name, response.text))
+
+    def apply_running_config(self, updated_config, checkpoint='ansible_candidate',
+                             rollback_checkpoint='ansible_rollback'):
+        '''
+        Applies updated_config, a full running-config, as a single
+        transaction. The running-config is saved to rollback_checkpoint
+        and updated_config is written to checkpoint and read back, then
+        checkpoint is copied to running-config on the switch. When that
+        copy fails the running-config is restored from rollback_checkpoint.
+        '''
+        if not (self._connected and self._http_session_handle):
+            raise AnsibleConnectionFailure('Not connected to %s' % self._remote_host)
+
+        ok, text = self._copy_config('running-config', rollback_checkpoint)
+        if not ok:
+            raise AnsibleConnectionFailure('Saving checkpoint %s failed: %s' % (rollback_checkpoint, text))
+
+        result = {'checkpoint': checkpoint, 'rollback_checkpoint': rollback_checkpoint}
+        keep_rollback = False
+        try:
+            response = self._request('PUT', self._fullconfig_url(checkpoint), data=updated_config)
+            if response.status_code not in (200, 204):
+                raise AnsibleConnectionFailure('Writing checkpoint %s failed: %s' % (checkpoint, response.text))
+            # The switch may add defaults, so only check every section got there
+            response = self._request('GET', self._fullconfig_url(checkpoint))
+            written = response.json() if response.status_code == 200 else {}
+            missing = [key for key in json.loads(updated_config) if key not in written]
+            if response.status_code != 200 or missing:
+                raise AnsibleConnectionFailure('Checkpoint %s is incomplete, missing %s' % (checkpoint, missing))
+
+            # A copy cut short may leave a partial running-config, so it is
+            # restored whether the copy failed or raised
+            try:
+                ok, text = self._copy_config(checkpoint, 'running-config')
+            except Exception as err:
+                ok, text = False, str(err)
+            if not ok:
+                # Keep the rollback checkpoint to recover by hand unless
+                # the restore succeeds
+                keep_rollback = True
+                try:
+                    restored, rollback_text = self._copy_config(rollback_checkpoint, 'running-config')
+                except Exception as err:
+                    restored, rollback_text = False, str(err)
+                if not restored:
+                    raise AnsibleConnectionFailure('Applying checkpoint %s failed: %s, restoring %s failed: %s'
+                                                   % (checkpoint, text, rollback_checkpoint, rollback_text))
+                keep_rollback = False
+                result.update(applied=False, rolled_back=True, msg=text)
+            else:
+                result.update(applied=True, rolled_back=False)
+        finally:
+            self._delete_checkpoint(checkpoint)
+            if not keep_rollback:
+                self._delete_checkpoint(rollback_checkpoint)
+        return result
+
+    def get_config_path(self, path, depth=None):
+        '''
+        GETs the writable configuration of a single resource, e.g.
+        /system/vlans/10, or None if it does not exist
+        '''
+        if self._connected and self._http_session_handle:
+            params = {'selector': 'writable'}
+            if depth:
+                params['depth'] = depth
+            response = self._request('GET', self._rest_url(path), params=params)
+            if response.status_code == 404:
+                return None
+            if response.status_code != 200:
+                raise AnsibleConnectionFailure('GET %s failed: %s' % (path, response.text))
+            return response.json()
+
+    def put_config_path(self, path, config):
+        '''
+        PUTs the writable configuration of a single resource
+        '''
+        if self._connected and self._http_session_handle:
+            response = self._request('PUT', self._rest_url(path), data=json.dumps(config))
+            return response.status_code, response.text
+
+    def patch_config_path(self, path, desired, atomic=False):
+        '''
+        Applies desired, a partial configuration of the resource at path.
+        Only that resource is sent when it exists and accepts the PUT,
+        otherwise the change is made through a PUT of the full
+        running-config, or through apply_running_config when atomic.
+        Returns whether the configuration changed and the JSON patch
+        applied to the resource.
+        '''
+        current = self.get_config_path(path)
+        if current is not None:
+            updated = merge_config(current, desired)
+            patch = json_patch(current, updated)
+            if not patch:
+                return {'changed': False, 'patch': patch}
+            status, text = self.put_config_path(path, updated)
+            if status in (200, 204):
+                return {'changed': True, 'patch': patch}
+            display.vvvv('PUT %s failed: %s, using the full running-config' % (path, text))
+
+        keys = full_config_keys(path)
+        config = json.loads(self.get_running_config())
+        parent = config
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        current = parent.get(keys[-1])
+        updated = merge_config(current or {}, desired)
+        patch = json_patch(current, updated)
+        if not patch:
+            return {'changed': False, 'patch': patch}
+        parent[keys[-1]] = updated
+        if atomic:
+            result = self.apply_running_config(json.dumps(config))
+            if not result['applied']:
+                raise AnsibleConnectionFailure('Applying %s failed, running-config rolled back: %s'
+                                               % (path, result['msg']))
+        else:
+            # put_running_config only returns the text of the answer
+            response = self._request('PUT', self._run_config_url, data=json.dumps(config))
+            if response.status_code not in (200, 204):
+                raise AnsibleConnectionFailure('PUT of the running-config for %s failed: %s'
+                                               % (path, response.text))
+        return {'changed': True, 'patch': patch}
@@ -37,6 +37,59 @@ options:
         description:
             - The api version to use (e.g. C(v6.0)).
             - Required when I(use_ssl=True).
+            - When not given, the latest version supported by the switch is
+              discovered through C(/version).
         default: 'None'
         type: str
+    session_cache:
+        description:
+            - Set to C(True) to keep the REST login session open at the end
+              of the task and reuse its cookie in the next tasks against the
+              same switch, user and I(api_version), instead of logging in
+              and out in every task.
+            - Cookies are stored on the controller in I(session_cache_path).
+              Expired or rejected cookies are dropped and a new login is
+              done transparently.
+        default: False
+        type: bool
+    session_cache_ttl:
+        description:
+            - Time in seconds a cached session cookie is reused. Should be
+              lower than the REST session idle timeout of the switch.
+        default: 300
+        type: int
+    session_cache_path:
+        description:
+            - File used to store the cached session cookies.
+        default: '~/.ansible/arubaoss/session_cache.json'
+        type: path
+    version_cache:
+        description:
+            - Set to C(True) to remember the REST API version discovered on
+              the switch in I(version_cache_path), so later tasks skip the
+              C(/version) probe.
+            - The entry is dropped when the switch reports another firmware
+              and after M(arubaoss_reboot) or a firmware download with
+              M(arubaoss_file_transfer).
+            - Not used when I(api_version) is given explicitly.
+        default: False
+        type: bool
+    version_cache_path:
+        description:
+            - File used to store the discovered REST API versions.
+        default: '~/.ansible/arubaoss/version_cache.json'
+        type: path
+    http_pool_size:
+        description:
+            - Number of idle keep-alive HTTP(S) connections kept open to the
+              switch and reused by the REST requests of the task.
+            - Set to C(0) to open a new connection for every request.
+        default: 1
+        type: int
+    http_idle_timeout:
+        description:
+            - Time in seconds after which an idle keep-alive connection is
+              closed instead of being reused.
+        default: 10
+        type: int
 '''
\ No newline at end of file
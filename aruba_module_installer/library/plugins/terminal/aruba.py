@@ -27,34 +27,52 @@ from ansible.module_utils._text import to_text, to_bytes
 from ansible.plugins.terminal import TerminalBase
 
 
+class TailRegex(object):
+    '''
+    Compiled prompt regex searched from the start of the last line of the
+    data. Prompt patterns all end with $, while searching the whole chunk
+    received costs a backtracking pass per position for (.+)?# and alike.
+    '''
+
+    def __init__(self, pattern):
+        self._regex = re.compile(pattern)
+        self.pattern = self._regex.pattern
+
+    def search(self, data):
+        end = len(data.rstrip())
+        return self._regex.search(data, max(data.rfind(b'\n', 0, end), 0))
+
+
 class TerminalModule(TerminalBase):
 
+    # Each list is tried regex by regex on every chunk received, so the
+    # patterns are combined into as few alternations as their flags allow.
     ansi_re = [
         # check ECMA-48 Section 5.4 (Control Sequences)
-        re.compile(br'(\x1b\[\?1h\x1b=)'),
-        re.compile(br'((?:\x9b|\x1b\x5b)[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e])'),
+        re.compile(br'(\x1b\[\?1h\x1b=)'
+                   br'|((?:\x9b|\x1b\x5b)[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e])'),
         re.compile(br'\x08.')
     ]
 
     terminal_stdout_re = [
-        re.compile(br"[\r\n]?[\w]*\(.+\)\s*[\^\*]?(?:\[.+\])? ?#(?:\s*)$"),
-        re.compile(br"[pP]assword:$"),
-        re.compile(br"(?<=\s)[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?\s*#\s*$"),
-        re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$"),
-        re.compile(br"[\r\n]?[\w]*(.+)?#(?:\s*)$"),
-        re.compile(br"\[([yY]|[yY]es)/([nN]|[nN]o)\]:$")
+        TailRegex(br"[\r\n]?[\w]*\(.+\)\s*[\^\*]?(?:\[.+\])? ?#(?:\s*)$"
+                  br"|[pP]assword:$"
+                  br"|(?<=\s)[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?\s*#\s*$"
+                  br"|[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$"
+                  br"|[\r\n]?[\w]*(.+)?#(?:\s*)$"
+                  br"|\[([yY]|[yY]es)/([nN]|[nN]o)\]:$")
     ]
 
     terminal_stderr_re = [
-        re.compile(br"% ?Error"),
-        re.compile(br"Error:", re.M),
-        re.compile(br"^% \w+", re.M),
-        re.compile(br"% ?Bad secret"),
-        re.compile(br"invalid input", re.I),
-        re.compile(br"(?:incomplete|ambiguous) command", re.I),
-        re.compile(br"connection timed out", re.I),
-        re.compile(br"[^\r\n]+ not found", re.I),
-        re.compile(br"'[^']' +returned error code: ?\d+"),
+        re.compile(br"% ?Error"
+                   br"|Error:"
+                   br"|(?:^|(?<=\n))% \w+"
+                   br"|% ?Bad secret"
+                   br"|'[^']' +returned error code: ?\d+"),
+        re.compile(br"invalid input"
+                   br"|(?:incomplete|ambiguous) command"
+                   br"|connection timed out"
+                   br"|[^\r\n] not found", re.I),
     ]
 
     terminal_initial_prompt = b'Press any key to continue'
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Compares the peak memory (RSS) of reading a section of a large AOS-CX
+running-config with json.loads of the whole document, as
+get_running_config callers do, and with iter_json_members of the
+arubaoscx_rest connection plugin, as get_running_config_section does.
+
+A synthetic running-config with --interfaces interfaces and as many
+ports is written to a temporary file and read back 64KB at a time, like
+the streamed GET. Each measure runs in a process of its own so its peak
+RSS is not hidden by the previous ones.
+
+Usage, with Ansible installed, on Linux:
+    python benchmarks/running_config_rss.py [--interfaces N]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser, SUPPRESS
+from os.path import dirname, join, realpath
+from time import time
+
+ROOT = dirname(dirname(realpath(__file__)))
+LIBRARY = join(ROOT, 'aruba_module_installer', 'library')
+
+CHUNK_SIZE = 65536
+
+SECTIONS = [['System', 'vlans'], ['Interface']]
+
+
+def load_connection():
+    '''Returns the arubaoscx_rest connection plugin module'''
+    path = join(LIBRARY, 'plugins', 'connection', 'arubaoscx_rest.py')
+    try:
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        from imp import load_source
+        return load_source('arubaoscx_rest', path)
+    spec = spec_from_file_location('arubaoscx_rest', path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_config(path, interfaces):
+    config = {
+        'Interface': dict(('1/1/%d' % i, {'name': '1/1/%d' % i, 'type': 'system',
+                                          'description': 'access port %d' % i,
+                                          'user_config': {'admin': 'up', 'autoneg': 'on'},
+                                          'other_config': {'mtu': 1500, 'lacp': None},
+                                          'options': {'l2_mac_learning': 'true'},
+                                          'pm_info': {'connector': 'RJ45', 'speeds': [100, 1000]}})
+                          for i in range(interfaces)),
+        'Port': dict(('1/1/%d' % i, {'name': '1/1/%d' % i, 'admin': 'up',
+                                     'interfaces': ['/rest/v1/system/interfaces/1%%2F1%%2F%d' % i],
+                                     'vlan_tag': '/rest/v1/system/vlans/1',
+                                     'vlan_mode': 'access', 'routing': False})
+                     for i in range(interfaces)),
+        'System': {'hostname': 'core',
+                   'vlans': dict((str(v), {'id': v, 'name': 'VLAN%d' % v, 'admin': 'up'})
+                                 for v in range(1, 200))},
+    }
+    with open(path, 'w') as f:
+        json.dump(config, f)
+
+
+def chunks(path):
+    with open(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def rss_kb(field):
+    '''Returns the VmRSS or VmHWM (peak) of this process in KB'''
+    # ru_maxrss would start from the peak of the parent process, which
+    # built the whole config, while VmHWM starts afresh on exec
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def measure(path, mode, keys):
+    '''Reads the section at keys and prints its size, time and RSS delta'''
+    if mode == 'stream':
+        iter_json_members = load_connection().iter_json_members
+    base = rss_kb('VmRSS')
+    start = time()
+    if mode == 'stream':
+        section = dict(iter_json_members(chunks(path), keys))
+    else:
+        section = json.loads(''.join(chunks(path)))
+        for key in keys:
+            section = section[key]
+    elapsed = time() - start
+    peak = rss_kb('VmHWM') - base
+    print('{:6} {:14} {:6} members  {:.2f}s  peak RSS +{}MB'.format(
+        mode, '.'.join(keys), len(section), elapsed, peak // 1024))
+
+
+def main():
+    parser = ArgumentParser(description='Peak RSS of the running-config parse')
+    parser.add_argument('--interfaces', type=int, default=50000)
+    parser.add_argument('--measure', nargs='+', help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        path, mode = args.measure[:2]
+        measure(path, mode, args.measure[2:])
+        return 0
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        write_config(path, args.interfaces)
+        print('running-config of {} interfaces: {:.1f}MB'.format(
+            args.interfaces, os.path.getsize(path) / 1048576.0))
+        for keys in SECTIONS:
+            for mode in ('full', 'stream'):
+                subprocess.check_call([sys.executable, realpath(__file__),
+                                       '--measure', path, mode] + keys)
+    finally:
+        os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied. See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Replays CLI transcripts through the prompt, error and ANSI regexes of the
+aruba and arubaoss terminal plugins, as the network_cli receive loop of
+Ansible 2.5 to 2.9 applies them: the output is read 256 bytes at a time
+and every chunk strips the ANSI sequences of the last 256 bytes, then
+searches them for errors and for the prompt.
+
+The regexes of the plugins are timed against the ones they had before
+being combined (BASELINE, the aruba plugin adding YES_NO_PROMPT_RE),
+and both must find the same prompts and errors in every chunk.
+
+Usage, with Ansible installed:
+    python benchmarks/terminal_regex.py [--repeat N] [transcript ...]
+Transcripts default to benchmarks/transcripts/*.txt.
+"""
+
+from __future__ import print_function
+
+import re
+import sys
+from argparse import ArgumentParser
+from glob import glob
+from os.path import dirname, join, realpath
+from time import time
+
+ROOT = dirname(dirname(realpath(__file__)))
+LIBRARY = join(ROOT, 'aruba_module_installer', 'library')
+
+WINDOW = 256
+
+BASELINE = {
+    'ansi_re': [
+        re.compile(br'(\x1b\[\?1h\x1b=)'),
+        re.compile(br'((?:\x9b|\x1b\x5b)[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e])'),
+        re.compile(br'\x08.')
+    ],
+    'terminal_stdout_re': [
+        re.compile(br"[\r\n]?[\w]*\(.+\)\s*[\^\*]?(?:\[.+\])? ?#(?:\s*)$"),
+        re.compile(br"[pP]assword:$"),
+        re.compile(br"(?<=\s)[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?\s*#\s*$"),
+        re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$"),
+        re.compile(br"[\r\n]?[\w]*(.+)?#(?:\s*)$")
+    ],
+    'terminal_stderr_re': [
+        re.compile(br"% ?Error"),
+        re.compile(br"Error:", re.M),
+        re.compile(br"^% \w+", re.M),
+        re.compile(br"% ?Bad secret"),
+        re.compile(br"invalid input", re.I),
+        re.compile(br"(?:incomplete|ambiguous) command", re.I),
+        re.compile(br"connection timed out", re.I),
+        re.compile(br"[^\r\n]+ not found", re.I),
+        re.compile(br"'[^']' +returned error code: ?\d+"),
+    ],
+}
+
+
+YES_NO_PROMPT_RE = re.compile(br"\[([yY]|[yY]es)/([nN]|[nN]o)\]:$")
+
+
+def baseline(name):
+    regexes = dict(BASELINE)
+    if name == 'aruba':
+        regexes['terminal_stdout_re'] = BASELINE['terminal_stdout_re'] + [YES_NO_PROMPT_RE]
+    return regexes
+
+
+def load_terminal(name):
+    '''Returns the TerminalModule class of the terminal plugin name'''
+    path = join(LIBRARY, 'plugins', 'terminal', name + '.py')
+    try:
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        from imp import load_source
+        return load_source('terminal_' + name, path).TerminalModule
+    spec = spec_from_file_location('terminal_' + name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TerminalModule
+
+
+def windows(data):
+    '''Yields the window network_cli searches after each chunk of data'''
+    for end in range(WINDOW, len(data) + WINDOW, WINDOW):
+        yield data[max(end - WINDOW, 0):min(end, len(data))]
+
+
+def replay(regexes, data):
+    '''
+    Returns, for each chunk of data, whether an error and whether a
+    prompt was found in it
+    '''
+    found = []
+    for window in windows(data):
+        for regex in regexes['ansi_re']:
+            window = regex.sub(b'', window)
+        error = any(regex.search(window) for regex in regexes['terminal_stderr_re'])
+        prompt = any(regex.search(window) for regex in regexes['terminal_stdout_re'])
+        found.append((error, prompt))
+    return found
+
+
+def best_time(regexes, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time()
+        replay(regexes, data)
+        elapsed = time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of the terminal plugin regexes')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('transcripts', nargs='*')
+    args = parser.parse_args()
+
+    paths = args.transcripts or sorted(glob(join(ROOT, 'benchmarks', 'transcripts', '*.txt')))
+    transcripts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            transcripts.append((path, f.read()))
+
+    mismatches = 0
+    for name in ('arubaoss', 'aruba'):
+        terminal = load_terminal(name)
+        previous = baseline(name)
+        current = dict((key, getattr(terminal, key)) for key in BASELINE)
+        for path, data in transcripts:
+            expected = replay(previous, data)
+            found = replay(current, data)
+            different = len([1 for old, new in zip(expected, found) if old != new])
+            mismatches += different
+
+            baseline_time = best_time(previous, data, args.repeat)
+            current_time = best_time(current, data, args.repeat)
+            print('{:9} {:44} {:5} chunks  baseline {:.4f}s  current {:.4f}s  '
+                  'x{:.1f}  {} mismatches'.format(
+                      name, path.replace(ROOT + '/', ''), len(found), baseline_time,
+                      current_time, baseline_time / current_time, different))
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())